@@ -0,0 +1,90 @@
+"""
+Retrieval backend benchmark: Chroma (HNSW) vs the in-process NumPy backend (exact search).
+Reports per-batch latency for both and recall@k of Chroma against the exact NumPy results,
+plus how often the two return the same top-k sources.
+
+Queries are the features in data/sample_data.csv, embedded once up front so only search time is measured.
+With --self-queries, stored chunk embeddings (plus a little noise) are used as queries instead,
+which needs no embedding model download.
+
+Usage: python benchmarks/bench_retrieval.py [--top-k 5] [--repeats 20] [--dtype float16] [--self-queries]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from src.rag_system import COLLECTION_NAMES, ChromaBackend, get_collection, get_embedding_function  # noqa: E402
+from src.numpy_backend import NumpyBackend  # noqa: E402
+
+
+def load_queries(self_queries: bool, count: int):
+    if not self_queries:
+        df = pd.read_csv("data/sample_data.csv")
+        texts = [f"{r.feature_name} - {r.feature_description}" for r in df.itertuples()][:count]
+        return np.asarray(get_embedding_function()(texts), dtype=np.float32)
+    rng = np.random.default_rng(0)
+    stored = np.vstack([
+        np.asarray(get_collection(name).get(include=["embeddings"])["embeddings"], dtype=np.float32)
+        for name in COLLECTION_NAMES
+    ])
+    picked = stored[rng.choice(len(stored), size=min(count, len(stored)), replace=False)]
+    return picked + rng.normal(scale=0.02, size=picked.shape).astype(np.float32)
+
+
+def timed(backend, names, queries, top_k, repeats):
+    backend.query(names, queries, top_k)  # warm-up (loads index / HNSW segments)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = backend.query(names, queries, top_k)
+        samples.append(time.perf_counter() - start)
+    return results, np.asarray(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs NumPy retrieval backend benchmark")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--self-queries", action="store_true")
+    args = parser.parse_args()
+
+    names = list(COLLECTION_NAMES)
+    queries = load_queries(args.self_queries, args.queries).tolist()
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        numpy_backend = NumpyBackend(index_dir=index_dir, dtype=args.dtype)
+        exact, numpy_times = timed(numpy_backend, names, queries, args.top_k, args.repeats)
+    approx, chroma_times = timed(ChromaBackend(), names, queries, args.top_k, args.repeats)
+
+    recall_hits = recall_total = same_order = lists = 0
+    for exact_q, approx_q in zip(exact, approx):
+        for name in names:
+            exact_docs = [h["doc_snippet"] for h in exact_q[name]]
+            approx_docs = [h["doc_snippet"] for h in approx_q[name]]
+            recall_hits += len(set(exact_docs) & set(approx_docs))
+            recall_total += len(exact_docs)
+            same_order += exact_docs == approx_docs
+            lists += 1
+
+    print(f"{len(queries)} queries x {len(names)} collections, top_k={args.top_k}, {args.repeats} repeats")
+    for label, samples in (("chroma", chroma_times), (f"numpy/{args.dtype}", numpy_times)):
+        print(f"  {label:<14} batch p50 {np.percentile(samples, 50) * 1000:8.2f} ms"
+              f"   p95 {np.percentile(samples, 95) * 1000:8.2f} ms"
+              f"   per query {np.median(samples) / len(queries) * 1000:6.3f} ms")
+    print(f"  chroma recall@{args.top_k} vs exact: {recall_hits / max(recall_total, 1):.3f}")
+    print(f"  identical ranked lists: {same_order}/{lists}")
+
+
+if __name__ == "__main__":
+    main()
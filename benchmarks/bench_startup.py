@@ -0,0 +1,71 @@
+"""
+Cold-start benchmark: measures the startup paths that users actually hit in a fresh interpreter,
+`python main.py --help` and the gunicorn worker importing deploy.app, and checks that provider SDKs /
+Chroma are not pulled in by either. Exits non-zero if a path exceeds the budget, so it can gate CI or a deploy.
+tests/test_startup.py runs the same checks as part of the test suite.
+
+Usage: python benchmarks/bench_startup.py [--budget 1.5] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# startup paths: CLI help (runs all of main.py's top-level imports and argparse) and the gunicorn worker import
+STARTUP_PATHS = {
+    "main.py --help": "import runpy, sys; sys.argv = ['main.py', '--help']\n"
+                      "try:\n    runpy.run_path('main.py', run_name='__main__')\nexcept SystemExit:\n    pass",
+    "import deploy.app": "import deploy.app",
+}
+
+# heavy modules that must only be imported when actually used
+LAZY_MODULES = ("openai", "google.genai", "chromadb")
+DEFAULT_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+
+
+def time_startup(code: str, runs: int, env: dict | None = None) -> float:
+    """Best-of-N wall time (seconds) of running a startup path in a fresh interpreter."""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def eagerly_imported(code: str, env: dict | None = None) -> list[str]:
+    """Return the LAZY_MODULES that got imported as a side effect of a startup path."""
+    code += f"\nimport sys\nprint('LAZY:' + ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    line = next(line for line in out.splitlines() if line.startswith("LAZY:"))
+    return [m for m in line[len("LAZY:"):].split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help="maximum allowed import time in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for name, code in STARTUP_PATHS.items():
+        elapsed = time_startup(code, args.runs)
+        eager = eagerly_imported(code)
+        print(f"{name}: {elapsed:.3f}s (budget {args.budget:.3f}s, best of {args.runs})")
+        if eager:
+            print(f"[FAIL] {name} imports modules that should be lazy: {', '.join(eager)}")
+        if elapsed > args.budget:
+            print(f"[FAIL] {name} over budget")
+        failed = failed or bool(eager) or elapsed > args.budget
+    if failed:
+        sys.exit(1)
+    print("[OK] startup within budget")
+
+
+if __name__ == "__main__":
+    main()
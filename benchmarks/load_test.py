@@ -0,0 +1,250 @@
+"""
+Load test for the Flask deployment (deploy.app:app under gunicorn) with the stub LLM provider.
+
+Starts gunicorn with LLM_PROVIDER=stub and an injected LLM latency, then drives open-loop (Poisson arrival)
+traffic of single-feature /analyze_one requests and CSV /upload requests at the configured rates.
+Reports throughput, latency percentiles and error rates per request type, and the RSS of each gunicorn worker.
+Use it to size --workers / --threads for a container and to catch throughput regressions before a deploy.
+
+Usage:
+  python benchmarks/load_test.py --workers 2 --threads 4 --duration 60 \\
+      --single-rate 2 --upload-rate 0.2 --upload-rows 20 --latency-ms 800
+  python benchmarks/load_test.py --url http://localhost:5000 ...   # drive an already running server
+"""
+import argparse
+import io
+import json
+import os
+import random
+import signal
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LOCATIONS = [
+    "EU Digital Service Act",
+    "California state law",
+    "Florida state law",
+    "Utah state law",
+    "US law on reporting child sexual abuse content to NCMEC",
+]
+
+
+def start_server(port: int, workers: int, threads: int, latency_ms: float, data_dir: str) -> subprocess.Popen:
+    # run outputs, results store and retrieval index go to data_dir, not the real outputs/
+    env = dict(os.environ, LLM_PROVIDER="stub", STUB_LATENCY_MS=str(latency_ms), WEB_CONCURRENCY=str(workers),
+               OUTPUT_DIR=data_dir, RESULTS_STORE_PATH=os.path.join(data_dir, "results.sqlite3"),
+               RETRIEVAL_INDEX_PATH=os.path.join(data_dir, "retrieval_index.sqlite3"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--timeout", "0",
+         "--workers", str(workers), "--threads", str(threads), "deploy.app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2)
+            return proc
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    proc.kill()
+    raise RuntimeError("gunicorn did not start within 60s")
+
+
+def worker_pids(master_pid: int) -> list[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == master_pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return pids
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of every gunicorn worker once per second."""
+
+    def __init__(self, master_pid: int):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.samples: dict[int, list[float]] = {}
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(1.0):
+            for pid in worker_pids(self.master_pid):
+                self.samples.setdefault(pid, []).append(rss_mb(pid))
+
+
+def post_single(base_url: str, features: pd.DataFrame) -> int:
+    row = features.sample(1).iloc[0]
+    body = urllib.parse.urlencode({
+        "feature_name": row["feature_name"],
+        "feature_description": row["feature_description"],
+        "location": random.choice(LOCATIONS),
+    }).encode()
+    with urllib.request.urlopen(f"{base_url}/analyze_one", data=body, timeout=600) as resp:
+        resp.read()
+        return resp.status
+
+
+def post_upload(base_url: str, features: pd.DataFrame, rows: int) -> int:
+    csv = io.BytesIO()
+    features.sample(rows, replace=len(features) < rows)[["feature_name", "feature_description"]].to_csv(csv, index=False)
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"location\"\r\n\r\n{random.choice(LOCATIONS)}\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"load.csv\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode() + csv.getvalue() + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(f"{base_url}/upload", data=body,
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=600) as resp:
+        text = resp.read().decode("utf-8", errors="replace")
+        # the app reports processing failures as a 200 with an error message
+        return resp.status if not text.startswith("Error") else 500
+
+
+def run_load(base_url: str, duration: float, single_rate: float, upload_rate: float, upload_rows: int,
+             features: pd.DataFrame) -> list[dict]:
+    records = []
+    lock = threading.Lock()
+
+    def fire(kind: str):
+        start = time.perf_counter()
+        try:
+            status = post_single(base_url, features) if kind == "single" else post_upload(base_url, features, upload_rows)
+            error = None if status < 400 else f"HTTP {status}"
+        except Exception as e:
+            error = type(e).__name__
+        with lock:
+            records.append({"kind": kind, "start": start, "latency": time.perf_counter() - start, "error": error})
+
+    # open loop: arrivals are scheduled independently of responses, so saturation shows up as growing latency
+    arrivals = []
+    for kind, rate in (("single", single_rate), ("upload", upload_rate)):
+        t = 0.0
+        while rate > 0:
+            t += random.expovariate(rate)
+            if t >= duration:
+                break
+            arrivals.append((t, kind))
+    arrivals.sort()
+
+    with ThreadPoolExecutor(max_workers=256) as pool:
+        start = time.perf_counter()
+        for at, kind in arrivals:
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, kind)
+    return records
+
+
+def report(records: list[dict], duration: float, memory: dict[int, list[float]]) -> dict:
+    summary = {}
+    for kind in ("single", "upload"):
+        recs = [r for r in records if r["kind"] == kind]
+        if not recs:
+            continue
+        ok = np.array([r["latency"] for r in recs if r["error"] is None])
+        errors = [r["error"] for r in recs if r["error"] is not None]
+        summary[kind] = {
+            "requests": len(recs),
+            "throughput_rps": len(ok) / duration,
+            "error_rate": len(errors) / len(recs),
+            "errors": {e: errors.count(e) for e in set(errors)},
+            **({f"p{p}_s": float(np.percentile(ok, p)) for p in (50, 90, 95, 99)} if len(ok) else {}),
+        }
+    summary["workers"] = {
+        str(pid): {"rss_mb_avg": float(np.mean(s)), "rss_mb_peak": float(np.max(s))}
+        for pid, s in memory.items() if s
+    }
+
+    print(f"\n=== load test: {duration:.0f}s ===")
+    for kind in ("single", "upload"):
+        if kind in summary:
+            s = summary[kind]
+            pct = "  ".join(f"p{p} {s[f'p{p}_s']:.2f}s" for p in (50, 90, 95, 99) if f"p{p}_s" in s)
+            print(f"{kind:<7} {s['requests']:5d} req  {s['throughput_rps']:6.2f} ok/s  "
+                  f"errors {s['error_rate'] * 100:5.1f}%  {pct}")
+            if s["errors"]:
+                print(f"        errors: {s['errors']}")
+    for pid, m in summary["workers"].items():
+        print(f"worker {pid}: RSS avg {m['rss_mb_avg']:.0f} MB, peak {m['rss_mb_peak']:.0f} MB")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask app with a stub LLM provider")
+    parser.add_argument("--url", default=None, help="target an already running server instead of starting gunicorn")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--latency-ms", type=float, default=800, help="mean injected LLM latency")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of traffic")
+    parser.add_argument("--single-rate", type=float, default=2.0, help="/analyze_one requests per second")
+    parser.add_argument("--upload-rate", type=float, default=0.2, help="/upload requests per second")
+    parser.add_argument("--upload-rows", type=int, default=20, help="features per uploaded CSV")
+    parser.add_argument("--json", default=None, help="also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    features = pd.read_csv(os.path.join(ROOT, "data", "sample_data.csv"))
+    server = None
+    data_dir = None
+    base_url = args.url
+    if base_url is None:
+        data_dir = tempfile.mkdtemp(prefix="load_test_")
+        server = start_server(args.port, args.workers, args.threads, args.latency_ms, data_dir)
+        base_url = f"http://127.0.0.1:{args.port}"
+    sampler = MemorySampler(server.pid) if server else None
+    if sampler:
+        sampler.start()
+
+    try:
+        records = run_load(base_url, args.duration, args.single_rate, args.upload_rate, args.upload_rows, features)
+    finally:
+        if sampler:
+            sampler.stop.set()
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = report(records, args.duration, sampler.samples if sampler else {})
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,95 @@
 import os
+import time
+import uuid
 import pandas as pd
-from flask import render_template, Flask, request, redirect, url_for, send_from_directory, flash
+from flask import render_template, Flask, request, redirect, url_for, flash, jsonify, abort, Response
+from werkzeug.utils import safe_join
 from src.compliance_analyzer import LLMCompliancePipeline
-from src.llm import GeminiProvider
+from src.llm import GeminiProvider, OpenAIProvider, StubProvider
+from src.retrieval_index import RetrievalIndex, DEFAULT_INDEX_PATH, feature_key
+from src.results_store import ResultsStore, DEFAULT_STORE_PATH, RUN_SORT_COLUMNS
+from src import concurrency
+from src.singleflight import SingleFlight
 from datetime import datetime
 
-# where we save CSV outputs for download
-OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "outputs")
+# where we save CSV outputs for download, the results store and the retrieval index
+# (overridable so benchmarks/load_test.py can keep its runs out of the real ones)
+OUTPUT_DIR = os.getenv("OUTPUT_DIR") or os.path.join(os.path.dirname(__file__), "..", "outputs")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+RESULTS_STORE_PATH = os.getenv("RESULTS_STORE_PATH") or DEFAULT_STORE_PATH
+RETRIEVAL_INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH") or DEFAULT_INDEX_PATH
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv'}
+# rows per page served to the results table
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# rows read from a run's CSV at a time when streaming a download
+DOWNLOAD_CHUNK_ROWS = 1000
+# opt-in: runs (stored rows and CSV) older than this are deleted when a new run is saved; 0 keeps them forever
+RUN_RETENTION_DAYS = float(os.getenv("RUN_RETENTION_DAYS", "0"))
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# identical analyses running concurrently in this worker (double submits, several users) share one computation
+analysis_flight = SingleFlight()
+# every verdict is stored; repeat analyses with the same model and regulations are answered from the store
+results_store = ResultsStore(RESULTS_STORE_PATH)
+
 # Create the upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+def make_llm_provider():
+    """LLM_PROVIDER=gemini (default) | openai | stub (offline, for benchmarks/load_test.py)"""
+    provider = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if provider == "openai":
+        return OpenAIProvider(model="gpt-4o-mini")
+    if provider == "stub":
+        return StubProvider()
+    return GeminiProvider(model="gemini-2.5-flash")
+
+def make_pipeline(llm_provider, location):
+    # stub verdicts are random filler, so they are neither stored nor answered from the store
+    return LLMCompliancePipeline(llm_provider=llm_provider, location=location,
+                                 retrieval_index=RetrievalIndex(RETRIEVAL_INDEX_PATH), flight=analysis_flight,
+                                 results_store=None if isinstance(llm_provider, StubProvider) else results_store)
+
+def save_run(results, df, pipeline) -> str:
+    """Save a run's results as a CSV in OUTPUT_DIR (for download) and in the results store (for paging); returns the run id."""
+    run_id = f"compliance_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    out_df = pd.DataFrame([{
+        "feature_name": r.feature_name,
+        "compliance_flag": r.compliance_flag.value,
+        "confidence_score": r.confidence_score,
+        "reasoning": r.reasoning,
+        "related_regulations": "; ".join(r.related_regulations),
+        "geo_regions": "; ".join(r.geo_regions),
+    } for r in results])
+    out_path = os.path.join(OUTPUT_DIR, f"{run_id}.csv")
+    out_df.to_csv(out_path, index=True)
+    results_store.save_run(run_id, results)
+    cleanup_runs()
+    # register the CSV's rows so `main.py reanalyze --results <csv>` can update them
+    if len(results) == len(df):
+        pipeline.retrieval_index.record_results(out_path, [
+            (row, "", feature_key(fn, fd, pipeline.location))
+            for row, (fn, fd) in enumerate(zip(df["feature_name"], df["feature_description"]))
+        ])
+    return run_id
+
+def cleanup_runs():
+    """Delete runs older than RUN_RETENTION_DAYS: their stored rows, CSV and reanalyze registration."""
+    if RUN_RETENTION_DAYS <= 0:
+        return
+    retrieval_index = None
+    for run_id in results_store.delete_runs_before(time.time() - RUN_RETENTION_DAYS * 86400):
+        path = os.path.join(OUTPUT_DIR, f"{run_id}.csv")
+        retrieval_index = retrieval_index or RetrievalIndex(RETRIEVAL_INDEX_PATH)
+        retrieval_index.forget_results(path)
+        if os.path.exists(path):
+            os.remove(path)
+
 # Check if the file extension is allowed
 def allowed_file(filename):
     return '.' in filename and \
@@ -54,31 +126,14 @@ def upload_file():
         global_location = raw_loc or None
 
         # init provider + pipeline
-        # llm_provider = OpenAIProvider(model="gpt-4o-mini")
-        llm_provider = GeminiProvider(model="gemini-2.5-flash")
-        pipeline = LLMCompliancePipeline(llm_provider=llm_provider, location=global_location)
+        llm_provider = make_llm_provider()
+        pipeline = make_pipeline(llm_provider, global_location)
 
         # process with ONE location for all rows
         results = pipeline.process_dataset(df)
 
-        # build output df
-        out_df = pd.DataFrame([{
-            "feature_name": r.feature_name,
-            "compliance_flag": r.compliance_flag.value,
-            "confidence_score": r.confidence_score,
-            "reasoning": r.reasoning,
-            "related_regulations": "; ".join(r.related_regulations),
-            "geo_regions": "; ".join(r.geo_regions),
-        } for r in results])
-
-        # save + render
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_name = f"compliance_results_{ts}.csv"
-        out_path = os.path.join(OUTPUT_DIR, out_name)
-        out_df.to_csv(out_path, index=True)
-
-        csv_html = out_df.to_html(classes="dataframe table-auto w-full")
-        return render_template('output.html', table_data=csv_html)
+        # save; the page fetches rows from /results/<run_id>/rows as needed
+        return render_template('output.html', run_id=save_run(results, df, pipeline))
     except Exception as e:
         return f"Error processing file: {e}"
 
@@ -100,24 +155,81 @@ def analyze_one():
     df = pd.DataFrame([{"feature_name": feature_name, "feature_description": desc_with_hint}])
 
     # pick provider
-    # llm_provider = OpenAIProvider(model="gpt-4o-mini")
-    llm_provider = GeminiProvider(model="gemini-2.5-flash")
+    llm_provider = make_llm_provider()
 
-    pipeline = LLMCompliancePipeline(llm_provider=llm_provider, location=location)
+    pipeline = make_pipeline(llm_provider, location)
     results = pipeline.process_dataset(df)
+    return render_template('output.html', run_id=save_run(results, df, pipeline))
 
-    # build result table for output.html
-    table_df = pd.DataFrame([{
-        "feature_name": r.feature_name,
-        "compliance_flag": r.compliance_flag.value,
-        "confidence_score": r.confidence_score,
-        "reasoning": r.reasoning,
-        "related_regulations": "; ".join(r.related_regulations),
-        "geo_regions": "; ".join(r.geo_regions),
-    } for r in results])
 
-    csv_html = table_df.to_html(classes="dataframe table-auto w-full")
-    return render_template('output.html', table_data=csv_html)
+# one page of a run's results: ?page=1&per_page=50&sort=confidence_score&order=desc&flag=REQUIRED&region=EU
+# (flag and region may be repeated or comma-separated; a row matches any of them)
+@app.route('/results/<run_id>/rows')
+def results_rows(run_id):
+    def listed(name):
+        return [v.strip() for value in request.args.getlist(name) for v in value.split(',') if v.strip()]
+
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(MAX_PAGE_SIZE, max(1, int(request.args.get('per_page', DEFAULT_PAGE_SIZE))))
+        sort = request.args.get('sort', 'position')
+        total, rows = results_store.run_page(
+            run_id, flags=listed('flag'), regions=listed('region'), sort=sort,
+            descending=request.args.get('order', 'asc').lower() == 'desc',
+            limit=per_page, offset=(page - 1) * per_page
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e), "sortable": list(RUN_SORT_COLUMNS)}), 400
+    return jsonify({
+        "run_id": run_id,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page,
+        "regions": results_store.run_regions(run_id),
+        "rows": rows,
+    })
+
+
+# record a reviewer's tick and/or reasoning edit on one row: {"reviewed": true, "reasoning": "..."}
+@app.route('/results/<run_id>/rows/<int:position>', methods=['PATCH'])
+def update_result_row(run_id, position):
+    body = request.get_json(silent=True) or {}
+    reviewed, reasoning = body.get('reviewed'), body.get('reasoning')
+    if (reviewed is not None and not isinstance(reviewed, bool)) or (reasoning is not None and not isinstance(reasoning, str)):
+        return jsonify({"error": "expected {\"reviewed\": bool, \"reasoning\": str}"}), 400
+    if not results_store.update_run_row(run_id, position, reviewed, reasoning):
+        return jsonify({"error": f"no row {position} in run {run_id}"}), 404
+    return jsonify({"run_id": run_id, "position": position, "reviewed": reviewed, "reasoning": reasoning})
+
+
+# the run's CSV with the reviewer's ticks and edited reasoning, streamed from disk in chunks rather than built in memory
+@app.route('/results/<run_id>/download')
+def results_download(run_id):
+    path = safe_join(os.path.abspath(OUTPUT_DIR), f"{run_id}.csv")
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    review = results_store.run_review(run_id)
+
+    def generate():
+        for i, chunk in enumerate(pd.read_csv(path, index_col=0, chunksize=DOWNLOAD_CHUNK_ROWS)):
+            chunk["reviewed"] = [review.get(position, (False, None))[0] for position in chunk.index]
+            for position in chunk.index.intersection(list(review)):
+                if review[position][1] is not None:
+                    chunk.at[position, "reasoning"] = review[position][1]
+            yield chunk.to_csv(header=i == 0)
+
+    return Response(generate(), mimetype='text/csv',
+                    headers={"Content-Disposition": f"attachment; filename={run_id}.csv"})
+
+
+# current adaptive concurrency limits of this worker process, with their history
+@app.route('/concurrency')
+def concurrency_stats():
+    return jsonify({
+        "retrieval": concurrency.retrieval_limiter.stats(),
+        "llm": concurrency.llm_limiter.stats(),
+    })
 
 
 if __name__ == '__main__':
@@ -1,33 +1,241 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import multiprocessing
+import time
 from datetime import datetime
 from dotenv import load_dotenv
-from src.data_handler import load_data, generate_csv_output
+from src.data_handler import ComplianceResult, load_data, generate_csv_output, generate_matrix_csv_output
 from src.llm import GeminiProvider, OpenAIProvider
-from src.compliance_analyzer import LLMCompliancePipeline
+from src.compliance_analyzer import LLMCompliancePipeline, LOCATION_MAPPING
+from src.work_queue import open_queue, enqueue_csv, run_worker, merged_rows
+from src.rag_system import reindex_regulations
+from src.retrieval_index import RetrievalIndex, DEFAULT_INDEX_PATH, reanalyze_changed, feature_key
+from src.results_store import ResultsStore, DEFAULT_STORE_PATH, SORT_COLUMNS
 
-def main():
-    load_dotenv()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Geo-Regulator compliance analysis")
+    parser.add_argument("--input", default="data/sample_data.csv",
+                        help="CSV with feature_name and feature_description columns")
+    parser.add_argument("--output", default=None,
+                        help="output CSV path (default: compliance_results_<timestamp>.csv)")
+    parser.add_argument("--locations", nargs="+", default=None, metavar="LOCATION", choices=[*LOCATION_MAPPING, "all"],
+                        help="matrix mode: analyze every feature against each of these locations in one pass "
+                             f"(use 'all' for every jurisdiction: {', '.join(LOCATION_MAPPING)})")
+    parser.add_argument("--layout", choices=["long", "wide"], default="long",
+                        help="matrix mode CSV layout")
+    parser.add_argument("--concurrency-log", default=None, metavar="PATH",
+                        help="write the adaptive concurrency limits and their history to this JSON file")
+    parser.add_argument("--compact", action="store_true",
+                        help="compact LLM output (short keys, flag codes, capped reasoning) to cut output tokens")
+    parser.add_argument("--results-store", default=DEFAULT_STORE_PATH, metavar="PATH",
+                        help="SQLite store of every verdict; features already analyzed with the same model and "
+                             "regulations are answered from it")
+
+    # sharded execution over a shared work queue (SQLite file path or redis:// URL)
+    subparsers = parser.add_subparsers(dest="command")
+    enqueue = subparsers.add_parser("enqueue", help="split the --input CSV into shards on a work queue")
+    enqueue.add_argument("--queue", required=True, help="SQLite file path or redis:// URL")
+    enqueue.add_argument("--shard-size", type=int, default=50)
+    work = subparsers.add_parser("work", help="pull shards from a work queue until it is drained")
+    work.add_argument("--queue", required=True, help="SQLite file path or redis:// URL")
+    work.add_argument("--processes", type=int, default=1, help="worker processes to start on this host")
+    merge = subparsers.add_parser("merge", help="merge partial results from a work queue in input order")
+    merge.add_argument("--queue", required=True, help="SQLite file path or redis:// URL")
+
+    # targeted re-analysis after regulation changes
+    reanalyze = subparsers.add_parser("reanalyze",
+                                      help="re-run only features whose retrieved regulations changed, updating --results in place")
+    reanalyze.add_argument("--results", required=True, help="previous results CSV to update in place")
+    reanalyze.add_argument("--changed-since", type=datetime.fromisoformat, default=None, metavar="ISO_DATETIME",
+                           help="only consider regulation files modified after this time "
+                                "(default: everything that differs from the last ingested corpus snapshot)")
+    reanalyze.add_argument("--index", default=DEFAULT_INDEX_PATH, help="retrieval reverse index path")
+
+    subparsers.add_parser("reindex", help="rebuild the regulation collections with the current embedding engine")
+
+    # historical results
+    results = subparsers.add_parser("results", help="query stored verdicts from --results-store")
+    results.add_argument("--flag", choices=["REQUIRED", "NOT_REQUIRED", "UNCERTAIN"], default=None)
+    results.add_argument("--regulation", default=None, help="related regulation, e.g. 'EU DSA'")
+    results.add_argument("--region", default=None, help="geo region, e.g. EU")
+    results.add_argument("--location", default=None, help="location the feature was analyzed for")
+    results.add_argument("--feature", default=None, help="substring of the feature name")
+    results.add_argument("--model", default=None, help="model version, e.g. Gemini/gemini-2.5-flash")
+    results.add_argument("--since", type=datetime.fromisoformat, default=None, metavar="ISO_DATETIME")
+    results.add_argument("--sort", choices=SORT_COLUMNS, default="analyzed_at")
+    results.add_argument("--asc", action="store_true", help="ascending sort (default: descending)")
+    results.add_argument("--limit", type=int, default=50, help="max rows, 0 for all")
+    results.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    return parser.parse_args()
+
+
+def build_pipeline(compact_output: bool = False, location: str | None = None,
+                   index_path: str = DEFAULT_INDEX_PATH,
+                   store_path: str = DEFAULT_STORE_PATH) -> LLMCompliancePipeline:
     # Initialize LLM Provider
     # Use GeminiProvider or OpenAIProvider
     # llm_provider = OpenAIProvider(model="gpt-4-mini")
     llm_provider = GeminiProvider(model="gemini-2.5-flash")
 
     # Initialize Compliance Pipeline
-    pipeline = LLMCompliancePipeline(llm_provider=llm_provider)
+    return LLMCompliancePipeline(llm_provider=llm_provider, location=location, compact_output=compact_output,
+                                 retrieval_index=RetrievalIndex(index_path), results_store=ResultsStore(store_path))
+
+
+def result_row_entries(features: list[tuple[str, str]], location: str | None) -> list[tuple[int, str, str]]:
+    """(row, column_prefix, feature_key) for a results CSV with one row per input feature."""
+    return [(row, "", feature_key(fn, fd, location)) for row, (fn, fd) in enumerate(features)]
+
+
+def matrix_row_entries(features: list[tuple[str, str]], locations: list[str], layout: str) -> list[tuple[int, str, str]]:
+    """(row, column_prefix, feature_key) for a matrix CSV, matching generate_matrix_csv_output's row order."""
+    if layout == "long":
+        pairs = [(fn, fd, loc) for fn, fd in features for loc in locations]
+        return [(row, "", feature_key(fn, fd, loc)) for row, (fn, fd, loc) in enumerate(pairs)]
+    return [(row, f"{loc} | ", feature_key(fn, fd, loc))
+            for row, (fn, fd) in enumerate(features) for loc in locations]
+
+
+def write_concurrency_log(pipeline: LLMCompliancePipeline, path: str | None):
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(pipeline.concurrency_stats(), f, indent=2)
+        print(f"Concurrency history written to {path}")
+
+
+def print_stored_results(store: ResultsStore, args):
+    """Stream matching stored verdicts to stdout as a table, CSV or JSON lines."""
+    filters = {
+        "flag": args.flag, "regulation": args.regulation, "region": args.region, "location": args.location,
+        "feature": args.feature, "model_version": args.model,
+        "since": args.since.timestamp() if args.since else None,
+    }
+    columns = ["analyzed_at", "feature_name", "location", "compliance_flag", "confidence_score", "related_regulations",
+               "geo_regions", "source_file", "reasoning", "model_version", "corpus_version"]
+    writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction="ignore") if args.format == "csv" else None
+    if writer:
+        writer.writeheader()
+    shown = 0
+    for row in store.query(**filters, sort=args.sort, descending=not args.asc, limit=args.limit or None):
+        shown += 1
+        row["analyzed_at"] = datetime.fromtimestamp(row["analyzed_at"]).isoformat(timespec="seconds")
+        if args.format == "json":
+            print(json.dumps({c: row[c] for c in columns}))
+        elif writer:
+            writer.writerow(row)
+        else:
+            print(f"{row['analyzed_at']}  {row['compliance_flag']:<12} {row['confidence_score']:.2f}  "
+                  f"{row['feature_name'][:40]:<40}  {(row['location'] or '-')[:24]:<24}  {row['geo_regions'] or '-'}")
+    if args.format == "table":
+        print(f"\n{shown} of {store.count(**filters)} matching results")
+
+
+def record_result_rows(pipeline: LLMCompliancePipeline, output_file: str, df, result_count: int, entries):
+    """Register the rows of a results CSV in the retrieval index so `reanalyze` can update them later."""
+    if result_count != len(df):
+        print(f"Warning: {len(df) - result_count} features have no result; {output_file} can't be re-analyzed")
+        return
+    features = list(zip(df["feature_name"], df["feature_description"]))
+    pipeline.retrieval_index.record_results(output_file, entries(features))
+
+
+def work_process(queue_url: str, compact_output: bool = False, store_path: str = DEFAULT_STORE_PATH):
+    """Entry point of one worker process: its own queue connection and pipeline."""
+    load_dotenv()
+    run_worker(open_queue(queue_url), build_pipeline(compact_output, store_path=store_path))
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+
+    if args.command == "enqueue":
+        enqueue_csv(open_queue(args.queue), args.input, args.shard_size)
+        return
+    if args.command == "work":
+        if args.processes <= 1:
+            work_process(args.queue, args.compact, args.results_store)
+            return
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=work_process, args=(args.queue, args.compact, args.results_store)) for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        return
+    if args.command == "merge":
+        rows = merged_rows(open_queue(args.queue))
+        results = [ComplianceResult.from_dict(r) for r in rows]
+        output_file = args.output or f"compliance_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        generate_csv_output(results, output_file)
+        # workers analyze with the default pipeline (no location)
+        RetrievalIndex().record_results(output_file, result_row_entries(
+            [(r["feature_name"], r["feature_description"]) for r in rows], None))
+        print(f"\n✓ Merged {len(results)} results. Results saved to {output_file}")
+        return
+
+    if args.command == "reindex":
+        start = time.perf_counter()
+        reindex_regulations()
+        RetrievalIndex().snapshot_corpus()
+        print(f"\n✓ Re-indexed regulations in {time.perf_counter() - start:.1f}s")
+        return
+    if args.command == "reanalyze":
+        # a web run's CSV is outputs/<run_id>.csv; keep the rows its results page shows in step with it
+        run_id = os.path.splitext(os.path.basename(args.results))[0]
+        store = ResultsStore(args.results_store)
+
+        def update_run(rows):
+            if updated := store.update_run_results(run_id, rows):
+                print(f"Updated {updated} rows of web run {run_id} in {args.results_store}")
+
+        count = reanalyze_changed(
+            RetrievalIndex(args.index), args.results,
+            lambda location: build_pipeline(args.compact, location, args.index, args.results_store),
+            changed_since=args.changed_since, on_rows_updated=update_run
+        )
+        print(f"\n✓ Re-analyzed {count} features. Results updated in {args.results}")
+        return
+
+    if args.command == "results":
+        print_stored_results(ResultsStore(args.results_store), args)
+        return
+
+    pipeline = build_pipeline(args.compact, store_path=args.results_store)
 
     try:
-        df = load_data('data/sample_data.csv')
+        df = load_data(args.input)
     except FileNotFoundError as e:
         print(f"Error: {e}. Please ensure the data directory is correctly set up.")
         return
 
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = args.output or f"compliance_results_{timestamp}.csv"
+
+    if args.locations:
+        # Matrix mode: feature x jurisdiction in a single pass
+        locations = list(LOCATION_MAPPING) if "all" in args.locations else list(dict.fromkeys(args.locations))
+        matrix_results = pipeline.process_dataset_matrix(df, locations)
+        generate_matrix_csv_output(matrix_results, output_file, layout=args.layout)
+        record_result_rows(pipeline, output_file, df, len(matrix_results),
+                           lambda features: matrix_row_entries(features, locations, args.layout))
+        write_concurrency_log(pipeline, args.concurrency_log)
+        print(f"\n✓ Matrix compliance analysis complete. Results saved to {output_file}")
+        return
+
     # Process Dataset
     results = pipeline.process_dataset(df)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = f"compliance_results_{timestamp}.csv"
-    
+    write_concurrency_log(pipeline, args.concurrency_log)
+
     # save results to CSV
     generate_csv_output(results, output_file)
+    record_result_rows(pipeline, output_file, df, len(results),
+                       lambda features: result_row_entries(features, pipeline.location))
     print(f"\n✓ Compliance analysis complete. Results saved to {output_file}")
 
 if __name__ == "__main__":
@@ -4,7 +4,13 @@ from typing import List
 from .data_handler import ComplianceFlag, ComplianceResult, DomainKnowledge, load_regulations, load_regulations_by_directory
 from .llm import LLMProvider
 import time
-from .rag_system import query_collections
+from .rag_system import prefetch_query_embeddings, query_collections, query_collections_batch
+from .retrieval_index import RetrievalIndex, scan_corpus
+from .results_store import ResultsStore, corpus_version
+from . import concurrency
+from .concurrency import AdaptiveLimiter
+from .singleflight import SingleFlight, feature_flight_key
+from dataclasses import replace
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 PROMPT_TEMPLATE = """
@@ -30,10 +36,180 @@ Example response:
 Response:
 """
 
+MATRIX_PROMPT_TEMPLATE = """
+You are a compliance expert. Your task is to analyze a software feature against the regulations of several jurisdictions.
+Use only the provided regulations to inform your answer. If the regulations for a jurisdiction do not contain enough information, state that.
+---
+Relevant Regulations by Jurisdiction:
+{context}
+---
+Feature to analyze:
+Feature Name: {feature_name}
+Description: {feature_description}
+
+For EACH jurisdiction listed above, identify if geo-specific compliance logic is REQUIRED, NOT_REQUIRED, or UNCERTAIN
+based only on that jurisdiction's regulations. If it is REQUIRED, you MUST cite the relevant file path from the regulations.
+
+Respond with a JSON object keyed by the exact jurisdiction names: {jurisdictions}
+
+Example response:
+{{ "EU Digital Service Act": {{ "compliance_flag": "REQUIRED", "confidence_score": 0.95, "reasoning": "The feature removes flagged content, which is regulated by the DSA notice and action rules.",
+    "related_regulations": ["EU DSA"], "geo_regions": ["EU"], "source_file": "EU_DSA_Article_16.txt" }},
+  "Utah state law": {{ "compliance_flag": "NOT_REQUIRED", "confidence_score": 0.8, "reasoning": "No provision covers this feature.",
+    "related_regulations": [], "geo_regions": [], "source_file": "N/A" }} }}
+
+Response:
+"""
+
+# UI / CLI location names -> regulation collection names
+LOCATION_MAPPING = {
+    "EU Digital Service Act": "EU_DSA",
+    "California state law": "CS_CS_HB_3",
+    "Florida state law": "SB976_POKSMAA",
+    "Utah state law": "UTAH_SocialMediaRegulation",
+    "US law on reporting child sexual abuse content to NCMEC": "US_reporting_child_sexual_abuse",
+}
+
+# number of features embedded + retrieved together in matrix mode
+MATRIX_RETRIEVAL_BATCH_SIZE = 64
+
+# Compact output mode: short keys, one-letter flag codes and a capped reasoning length,
+# to cut the number of generated tokens per verdict.
+REASONING_MAX_CHARS = 200
+COMPACT_FLAG_CODES = {"R": ComplianceFlag.REQUIRED, "N": ComplianceFlag.NOT_REQUIRED, "U": ComplianceFlag.UNCERTAIN}
+
+COMPACT_OUTPUT_INSTRUCTIONS = f"""
+Respond with a compact JSON object using ONLY these keys:
+"f": "R" (REQUIRED), "N" (NOT_REQUIRED) or "U" (UNCERTAIN)
+"c": confidence score from 0.0 to 1.0
+"r": reasoning, at most {REASONING_MAX_CHARS} characters
+"l": related regulations, e.g. ["EU DSA"]
+"g": affected geo regions, e.g. ["EU"]
+"""
+
+# JSON Schemas passed to the LLM provider so decoding is constrained to a parseable verdict
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "compliance_flag": {"type": "string", "enum": [flag.value for flag in ComplianceFlag]},
+        "confidence_score": {"type": "number"},
+        "reasoning": {"type": "string"},
+        "related_regulations": {"type": "array", "items": {"type": "string"}},
+        "geo_regions": {"type": "array", "items": {"type": "string"}},
+        "source_file": {"type": "string"},
+    },
+    "required": ["compliance_flag", "confidence_score", "reasoning", "related_regulations", "geo_regions", "source_file"],
+    "additionalProperties": False,
+}
+
+COMPACT_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "f": {"type": "string", "enum": list(COMPACT_FLAG_CODES)},
+        "c": {"type": "number"},
+        "r": {"type": "string", "description": f"reasoning, at most {REASONING_MAX_CHARS} characters"},
+        "l": {"type": "array", "items": {"type": "string"}},
+        "g": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["f", "c", "r", "l", "g"],
+    "additionalProperties": False,
+}
+
+
+def retrieval_failed(retrieved_results: dict) -> bool:
+    """True if any collection came back as an {"error"} hit instead of search results."""
+    return any("error" in hit for hits in retrieved_results.values() for hit in hits)
+
+
+def compact_prompt(prompt: str, preamble: str = "") -> str:
+    """Swap the verbose example response at the end of a prompt template for the compact output instructions."""
+    return prompt[:prompt.index("Example response:")] + preamble + COMPACT_OUTPUT_INSTRUCTIONS + "\nResponse:\n"
+
+
+def routing_schema(directories: list[str]) -> dict:
+    """Schema for the regulation-directory routing response: one decision object per directory."""
+    decision = {
+        "type": "object",
+        "properties": {
+            "check_regulation": {"type": "boolean"},
+            "reasoning": {"type": "string"},
+        },
+        "required": ["check_regulation", "reasoning"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {directory: decision for directory in directories},
+        "required": list(directories),
+        "additionalProperties": False,
+    }
+
+
+def matrix_schema(locations: list[str], compact: bool = False) -> dict:
+    """Schema for a matrix response: one verdict object per location."""
+    verdict = COMPACT_VERDICT_SCHEMA if compact else VERDICT_SCHEMA
+    return {
+        "type": "object",
+        "properties": {loc: verdict for loc in locations},
+        "required": list(locations),
+        "additionalProperties": False,
+    }
+
+
+def check_locations(locations: list[str]):
+    """Reject location names without a regulation collection, instead of letting the LLM judge with no context."""
+    unknown = [loc for loc in locations if loc not in LOCATION_MAPPING]
+    if unknown:
+        raise ValueError(f"Unknown location(s) {', '.join(unknown)}, expected any of: {', '.join(LOCATION_MAPPING)}")
+
+
+def result_from_verdict(feature_name: str, verdict: dict, source_file: str, compact: bool = False) -> ComplianceResult:
+    """Map a (full or compact) verdict object from the LLM into a ComplianceResult."""
+    if compact:
+        return ComplianceResult(
+            feature_name=feature_name,
+            compliance_flag=COMPACT_FLAG_CODES[verdict["f"]],
+            confidence_score=float(verdict["c"]),
+            reasoning=verdict["r"][:REASONING_MAX_CHARS],
+            related_regulations=verdict.get("l", []),
+            geo_regions=verdict.get("g", []),
+            source_file=source_file
+        )
+    return ComplianceResult(
+        feature_name=feature_name,
+        compliance_flag=ComplianceFlag(verdict["compliance_flag"]),
+        confidence_score=float(verdict["confidence_score"]),
+        reasoning=verdict["reasoning"],
+        related_regulations=verdict.get("related_regulations", []),
+        geo_regions=verdict.get("geo_regions", []),
+        source_file=source_file
+    )
+
 class LLMCompliancePipeline:
-    def __init__(self, llm_provider: LLMProvider, location: str | None = None):
-        """Initialize the pipeline with an LLM provider."""
+    def __init__(self, llm_provider: LLMProvider, location: str | None = None, compact_output: bool = False,
+                 retrieval_index: RetrievalIndex | None = None,
+                 llm_limiter: AdaptiveLimiter | None = None, retrieval_limiter: AdaptiveLimiter | None = None,
+                 flight: SingleFlight | None = None, results_store: ResultsStore | None = None):
+        """
+        Initialize the pipeline with an LLM provider.
+        compact_output asks for short keys / flag codes / capped reasoning to cut output tokens.
+        retrieval_index, if given, records the regulation chunks retrieved for every analyzed feature.
+        llm_limiter / retrieval_limiter control in-flight calls per stage (default: the process-wide
+        adaptive limiters in src/concurrency.py).
+        flight, if given, lets identical concurrent analyses (e.g. across web requests) share one computation.
+        results_store, if given, stores every verdict and answers repeat analyses of the same feature content from
+        it while the model and the relevant regulation files are unchanged.
+        """
+        self.flight = flight
+        self.results_store = results_store
+        self.model_version = llm_provider.get_model_name() + ("+compact" if compact_output else "")
+        # regulation file hashes as of pipeline creation, for the corpus version of stored verdicts
+        self.corpus = scan_corpus() if results_store is not None else {}
         self.llm_provider = llm_provider
+        self.llm_limiter = llm_limiter or concurrency.llm_limiter
+        self.retrieval_limiter = retrieval_limiter or concurrency.retrieval_limiter
+        self.compact_output = compact_output
+        self.retrieval_index = retrieval_index
         self.domain_knowledge = DomainKnowledge()
         self.regulations_by_directory = None
         self.regulations = load_regulations(location=location)
@@ -134,7 +310,9 @@ class LLMCompliancePipeline:
 
         # Call LLM once
         try:
-            response = self.llm_provider.generate_json_response(prompt)
+            with self.llm_limiter.slot():
+                response = self.llm_provider.generate_json_response(
+                    prompt, schema=routing_schema(list(self.regulations_by_directory)))
             parsed = json.loads(response)
             return parsed
         except Exception as e:
@@ -143,7 +321,8 @@ class LLMCompliancePipeline:
             return {
                 directory: {
                     "check_regulation": False,
-                    "reasoning": f"LLM call failed: {str(e)}"
+                    "reasoning": f"LLM call failed: {str(e)}",
+                    "routing_failed": True,
                 }
                 for directory in self.regulations_by_directory
             }
@@ -188,15 +367,28 @@ class LLMCompliancePipeline:
     #         f"```\n"
     #     )
 
+    def corpus_version(self, location: str | None) -> str:
+        """Version of the regulations a verdict for `location` depends on (every directory when routing)."""
+        return corpus_version(self.corpus, None if location is None else [LOCATION_MAPPING.get(location, location)])
+
     def analyze_feature(self, feature_name: str, feature_description: str) -> ComplianceResult:
         """Analyze a single feature for compliance requirements."""
+        if self.results_store is not None:
+            stored = self.results_store.get(feature_name, feature_description, self.location,
+                                            self.model_version, self.corpus_version(self.location))
+            if stored is not None:
+                return stored
+
         # prompt = self.create_compliance_prompt(
         #     feature_name, feature_description)
         
         files_to_include = None
         directories_to_include = []
+        # degraded verdicts (routing fallback, failed retrieval) are returned but not stored
+        storable = True
         if self.location is None:
             decisions = self.filter_relevant_regulation_dirs(feature_name, feature_description)
+            storable = not any(decision.get("routing_failed") for decision in decisions.values())
             for i in decisions:
                 if decisions[i]["check_regulation"]:
                     directories_to_include.append(i)
@@ -206,20 +398,16 @@ class LLMCompliancePipeline:
             directories_to_include = [] ##change this dummy code
             ##files_to_include = self.regulations ## files_to_include = {file1: content1, file2: content2, ...}
 
-            LOCATION_MAPPING = {
-                "EU Digital Service Act": "EU_DSA",
-                "California state law": "CS_CS_HB_3",
-                "Florida state law": "SB976_POKSMAA",
-                "Utah state law": "UTAH_SocialMediaRegulation",
-                "US law on reporting child sexual abuse content to NCMEC": "US_reporting_child_sexual_abuse",
-            }
-
             directories_to_include.append(LOCATION_MAPPING.get(self.location, ""))
 
         try:
             # Retrieve documents using the custom retriever
             query = f"{feature_name} - {feature_description}"
-            retrieved_results = query_collections(directories_to_include, query, 5)
+            with self.retrieval_limiter.slot():
+                retrieved_results = query_collections(directories_to_include, query, 5)
+            storable = storable and not retrieval_failed(retrieved_results)
+            if self.retrieval_index is not None:
+                self.retrieval_index.record(feature_name, feature_description, self.location, retrieved_results)
             first_source_file = "N/A"
             all_snippets = []
             context = ""
@@ -239,22 +427,18 @@ class LLMCompliancePipeline:
                 feature_name=feature_name,
                 feature_description=feature_description
             )
-            
+            if self.compact_output:
+                prompt = compact_prompt(prompt)
+
             # print(prompt) # debugging
 
-            # Generate the response using the LLM provider
-            response_text = self.llm_provider.generate_json_response(prompt)
+            # Generate the response using the LLM provider, constrained to the verdict schema
+            schema = COMPACT_VERDICT_SCHEMA if self.compact_output else VERDICT_SCHEMA
+            with self.llm_limiter.slot():
+                response_text = self.llm_provider.generate_json_response(prompt, schema=schema)
             result_json = json.loads(response_text)
 
-            return ComplianceResult(
-                feature_name=feature_name,
-                compliance_flag=ComplianceFlag(result_json["compliance_flag"]),
-                confidence_score=float(result_json["confidence_score"]),
-                reasoning=result_json["reasoning"],
-                related_regulations=result_json.get("related_regulations", []),
-                geo_regions=result_json.get("geo_regions", []),
-                source_file=first_source_file
-            )
+            result = result_from_verdict(feature_name, result_json, first_source_file, self.compact_output)
         except Exception as e:
             print(f"Error analyzing '{feature_name}': {e}")
             return ComplianceResult(
@@ -267,22 +451,209 @@ class LLMCompliancePipeline:
                 source_file="N/A"
             )
 
+        if self.results_store is not None and storable:
+            self.results_store.put(result, feature_description, self.location,
+                                   self.model_version, self.corpus_version(self.location))
+        return result
+
+    def analyze_feature_shared(self, feature_name: str, feature_description: str) -> ComplianceResult:
+        """analyze_feature, coalesced with identical concurrent analyses when the pipeline has a SingleFlight group."""
+        if self.flight is None:
+            return self.analyze_feature(feature_name, feature_description)
+        key = feature_flight_key(feature_name, feature_description, self.location)
+        return self.flight.do(key, lambda: self.analyze_feature(feature_name, feature_description))
+
     def process_dataset(self, df) -> List[ComplianceResult]:
         """Process the entire dataset."""
         print(f"Using LLM: {self.llm_provider.get_model_name()}")
 
-        max_workers = min(8, len(df))
+        # collapse duplicate rows (same normalized name, description and location) into a single analysis
+        groups = {}
+        for idx, row in df.iterrows():
+            fn = row['feature_name']
+            fd = row['feature_description']
+            key = feature_flight_key(fn, fd, self.location)
+            groups.setdefault(key, (fn, fd, []))[2].append((idx, fn))
+        if len(groups) < len(df):
+            print(f"Collapsed {len(df)} rows into {len(groups)} unique features")
+
+        # each feature still retrieves on its own, but the local embedding engine can embed their queries in batches
+        try:
+            prefetch_query_embeddings([f"{fn} - {fd}" for fn, fd, _ in groups.values()])
+        except Exception as e:
+            print(f"Query embedding prefetch failed, embedding per feature: {e}")
+
+        # threads only bound the ceiling; the adaptive limiters decide how many calls are actually in flight
+        max_workers = max(1, min(self.llm_limiter.max_limit, len(groups)))
+        indexed_results = []
+
+        def worker(n, feature_name, feature_description):
+            print(f"[{n+1}/{len(groups)}] Analyzing: {feature_name}")
+            return self.analyze_feature_shared(feature_name, feature_description)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_map = {}
+            for n, (fn, fd, members) in enumerate(groups.values()):
+                fut = executor.submit(worker, n, fn, fd)
+                future_map[fut] = (fn, members)
+
+            for fut in as_completed(future_map):
+                fn, members = future_map[fut]
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    print(f"[ERROR] Failed {fn}: {e}")
+                    continue
+                for idx, name in members:
+                    # duplicates keep their own spelling of the feature name
+                    indexed_results.append((idx, res if name == res.feature_name else replace(res, feature_name=name)))
+
+        indexed_results.sort(key=lambda x: x[0])
+        self.print_concurrency_summary()
+        return [r for _, r in indexed_results]
+
+    def analyze_feature_matrix(self, feature_name: str, feature_description: str, locations: list[str],
+                               retrieved_results: dict | None = None) -> dict[str, ComplianceResult]:
+        """
+        Analyze a single feature against several jurisdictions with one LLM call.
+        `retrieved_results` may be passed in from a batched retrieval (see process_dataset_matrix);
+        otherwise the feature is retrieved here. Returns {location: ComplianceResult}.
+        """
+        check_locations(locations)
+        stored = self.stored_matrix(feature_name, feature_description, locations)
+        if stored is not None:
+            return stored
+        collection_for = {loc: LOCATION_MAPPING.get(loc, loc) for loc in locations}
+
+        def failed(reason: str) -> dict[str, ComplianceResult]:
+            return {
+                loc: ComplianceResult(
+                    feature_name=feature_name,
+                    compliance_flag=ComplianceFlag.UNCERTAIN,
+                    confidence_score=0.0,
+                    reasoning=reason,
+                    related_regulations=[],
+                    geo_regions=[],
+                    source_file="N/A"
+                )
+                for loc in locations
+            }
+
+        try:
+            if retrieved_results is None:
+                query = f"{feature_name} - {feature_description}"
+                with self.retrieval_limiter.slot():
+                    retrieved_results = query_collections(list(dict.fromkeys(collection_for.values())), query, 5)
+            if self.retrieval_index is not None:
+                # one entry per location, keyed like a single-location analysis, so reanalyze can target it
+                for loc in locations:
+                    self.retrieval_index.record(feature_name, feature_description, loc,
+                                                {collection_for[loc]: retrieved_results.get(collection_for[loc], [])})
+
+            sections = []
+            first_source_files = {}
+            for loc in locations:
+                snippets = []
+                first_source_files[loc] = "N/A"
+                for hit in retrieved_results.get(collection_for[loc], []):
+                    if "doc_snippet" in hit:
+                        snippets.append(f"Source: {hit['source']}\nContent: {hit['doc_snippet']}")
+                        if first_source_files[loc] == "N/A":
+                            first_source_files[loc] = hit['source']
+                body = "\n\n---\n\n".join(snippets) or "(no regulations retrieved)"
+                sections.append(f"=== Jurisdiction: {loc} ===\n{body}")
+
+            prompt = MATRIX_PROMPT_TEMPLATE.format(
+                context="\n\n".join(sections),
+                feature_name=feature_name,
+                feature_description=feature_description,
+                jurisdictions=", ".join(json.dumps(loc) for loc in locations)
+            )
+            if self.compact_output:
+                prompt = compact_prompt(prompt, "Each jurisdiction's value must be a compact verdict object.")
+
+            with self.llm_limiter.slot():
+                response_text = self.llm_provider.generate_json_response(
+                    prompt, schema=matrix_schema(locations, self.compact_output))
+            result_json = json.loads(response_text)
+        except Exception as e:
+            print(f"Error analyzing '{feature_name}' (matrix): {e}")
+            return failed(f"Analysis failed: {str(e)}")
+
+        results = {}
+        for loc in locations:
+            verdict = result_json.get(loc)
+            if not isinstance(verdict, dict):
+                results[loc] = failed(f"Analysis failed: no verdict returned for '{loc}'")[loc]
+                continue
+            try:
+                results[loc] = result_from_verdict(feature_name, verdict, first_source_files[loc], self.compact_output)
+            except Exception as e:
+                results[loc] = failed(f"Analysis failed: {str(e)}")[loc]
+                continue
+            if self.results_store is not None and not retrieval_failed(
+                    {collection_for[loc]: retrieved_results.get(collection_for[loc], [])}):
+                self.results_store.put(results[loc], feature_description, loc,
+                                       self.model_version + "+matrix", self.corpus_version(loc))
+        return results
+
+    def stored_matrix(self, feature_name: str, feature_description: str,
+                      locations: list[str]) -> dict[str, ComplianceResult] | None:
+        """Stored matrix-mode verdicts for every location, or None unless all of them are in the results store."""
+        if self.results_store is None:
+            return None
+        results = {}
+        for loc in locations:
+            stored = self.results_store.get(feature_name, feature_description, loc,
+                                            self.model_version + "+matrix", self.corpus_version(loc))
+            if stored is None:
+                return None
+            results[loc] = stored
+        return results
+
+    def process_dataset_matrix(self, df, locations: list[str]) -> List[tuple[str, dict[str, ComplianceResult]]]:
+        """
+        Process the entire dataset against every location in one pass.
+        Features are embedded and retrieved in batches across all requested collections, then each
+        feature gets a single LLM call covering every jurisdiction.
+        Returns [(feature_name, {location: ComplianceResult}), ...] in input order.
+        """
+        check_locations(locations)
+        print(f"Using LLM: {self.llm_provider.get_model_name()}")
+        print(f"Matrix mode: {len(df)} features x {len(locations)} jurisdictions")
+
+        collection_names = list(dict.fromkeys(LOCATION_MAPPING.get(loc, loc) for loc in locations))
+        rows = [(row['feature_name'], row['feature_description']) for _, row in df.iterrows()]
+
+        # features with stored verdicts for every location skip retrieval and the LLM
+        stored = [self.stored_matrix(fn, fd, locations) for fn, fd in rows]
+        pending = [idx for idx, s in enumerate(stored) if s is None]
+        if len(pending) < len(rows):
+            print(f"{len(rows) - len(pending)} features answered from the results store")
+
+        retrieved = {}
+        for start in range(0, len(pending), MATRIX_RETRIEVAL_BATCH_SIZE):
+            batch = pending[start:start + MATRIX_RETRIEVAL_BATCH_SIZE]
+            queries = [f"{rows[idx][0]} - {rows[idx][1]}" for idx in batch]
+            try:
+                with self.retrieval_limiter.slot():
+                    retrieved.update(zip(batch, query_collections_batch(collection_names, queries, 5)))
+            except Exception as e:
+                # those features retry retrieval on their own in analyze_feature_matrix
+                print(f"Batch retrieval failed: {e}")
+
+        max_workers = max(1, min(self.llm_limiter.max_limit, len(rows)))
         indexed_results = []
 
         def worker(idx, feature_name, feature_description):
-            print(f"[{idx+1}/{len(df)}] Analyzing: {feature_name}")
-            return self.analyze_feature(feature_name, feature_description)
+            if stored[idx] is not None:
+                return stored[idx]
+            print(f"[{idx+1}/{len(rows)}] Analyzing (matrix): {feature_name}")
+            return self.analyze_feature_matrix(feature_name, feature_description, locations, retrieved.get(idx))
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_map = {}
-            for idx, row in df.iterrows():
-                fn = row['feature_name']
-                fd = row['feature_description']
+            for idx, (fn, fd) in enumerate(rows):
                 fut = executor.submit(worker, idx, fn, fd)
                 future_map[fut] = (idx, fn)
 
@@ -293,7 +664,21 @@ class LLMCompliancePipeline:
                 except Exception as e:
                     print(f"[ERROR] Failed {fn}: {e}")
                     continue
-                indexed_results.append((idx, res))
+                indexed_results.append((idx, (fn, res)))
 
         indexed_results.sort(key=lambda x: x[0])
+        self.print_concurrency_summary()
         return [r for _, r in indexed_results]
+
+    def concurrency_stats(self) -> dict:
+        """Current limit, in-flight calls, totals and limit history of each stage's limiter."""
+        return {
+            "retrieval": self.retrieval_limiter.stats(),
+            "llm": self.llm_limiter.stats(),
+        }
+
+    def print_concurrency_summary(self):
+        for name, stats in self.concurrency_stats().items():
+            limits = [h["limit"] for h in stats["history"]]
+            print(f"[concurrency] {name}: limit {stats['limit']} (min {min(limits)}, max {max(limits)}), "
+                  f"{stats['calls']} calls, {stats['errors']} errors, {stats['throttled']} throttled")
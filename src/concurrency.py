@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+
+def is_throttle_error(e: Exception) -> bool:
+    """True for rate-limit (429 / RESOURCE_EXHAUSTED), overload (503) and timeout errors from any provider SDK."""
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    if status in (429, 503, 504):
+        return True
+    if isinstance(e, TimeoutError) or "Timeout" in type(e).__name__:
+        return True
+    text = str(e)
+    return "RESOURCE_EXHAUSTED" in text or "rate limit" in text.lower()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one pipeline stage (e.g. LLM calls or retrieval).
+    The limit grows by `increase` after a full window of healthy calls (roughly one per round trip at the
+    current limit) and is multiplied by `decrease_factor` on a throttle / timeout error, when the median latency
+    of the last `window` successful calls goes over `latency_tolerance` x the baseline, or when the error rate
+    of the recent window goes over `max_error_rate`. The baseline is a slow EWMA of every successful call, so
+    single slow calls don't cut the limit and a lasting shift in latency becomes the new normal.
+    Decreases are rate-limited to one per `cooldown` seconds, so a burst of 429s counts as one congestion signal.
+    """
+
+    def __init__(self, name: str, initial: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 increase: int = 1, decrease_factor: float = 0.5, latency_tolerance: float = 2.0,
+                 max_error_rate: float = 0.2, window: int = 20, cooldown: float = 2.0,
+                 baseline_weight: float = 0.02):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(initial, max_limit))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.baseline_weight = baseline_weight
+
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self.recent = deque(maxlen=window)  # True for a failed call
+        self.latencies = deque(maxlen=window)  # latencies of recent successful calls
+        self.history = deque(maxlen=1000)  # (timestamp, limit, in_flight, reason)
+        self.totals = {"calls": 0, "errors": 0, "throttled": 0}
+        self._successes_since_increase = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._record("initial")
+
+    def _record(self, reason: str):
+        self.history.append((time.time(), self.limit, self.in_flight, reason))
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, error: Optional[Exception] = None):
+        with self._cond:
+            self.in_flight -= 1
+            self.totals["calls"] += 1
+            self.recent.append(error is not None)
+
+            if error is not None:
+                self.totals["errors"] += 1
+                if is_throttle_error(error):
+                    self.totals["throttled"] += 1
+                    self._decrease("throttled")
+                elif sum(self.recent) / len(self.recent) > self.max_error_rate:
+                    self._decrease("error rate")
+            else:
+                # the window's median is compared against the baseline before this call moves it (slow EWMA)
+                self.latencies.append(latency)
+                congested = (self.baseline_latency is not None and len(self.latencies) == self.latencies.maxlen
+                             and sorted(self.latencies)[len(self.latencies) // 2]
+                             > self.latency_tolerance * self.baseline_latency)
+                self.baseline_latency = latency if self.baseline_latency is None \
+                    else (1 - self.baseline_weight) * self.baseline_latency + self.baseline_weight * latency
+                if congested:
+                    # judge the next decrease on calls made at the new limit
+                    self.latencies.clear()
+                    self._decrease("latency")
+                else:
+                    self._successes_since_increase += 1
+                    if self._successes_since_increase >= self.limit and self.limit < self.max_limit:
+                        self.limit = min(self.max_limit, self.limit + self.increase)
+                        self._successes_since_increase = 0
+                        self._record("increase")
+            self._cond.notify_all()
+
+    def _decrease(self, reason: str):
+        now = time.time()
+        self._successes_since_increase = 0
+        if now - self._last_decrease < self.cooldown:
+            return
+        new_limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        self._last_decrease = now
+        if new_limit != self.limit:
+            self.limit = new_limit
+            self._record(reason)
+
+    @contextmanager
+    def slot(self):
+        """Hold one unit of concurrency for the duration of a call; outcome and latency feed the controller."""
+        self.acquire()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(time.perf_counter() - start, error)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "baseline_latency": self.baseline_latency,
+                **self.totals,
+                "history": [
+                    {"time": t, "limit": limit, "in_flight": in_flight, "reason": reason}
+                    for t, limit, in_flight, reason in self.history
+                ],
+            }
+
+
+# Process-wide limiters: provider quotas and CPU are shared by every pipeline in the process
+# (e.g. concurrent web requests), so the stages are controlled globally rather than per pipeline.
+llm_limiter = AdaptiveLimiter(
+    "llm",
+    initial=int(os.getenv("LLM_INITIAL_CONCURRENCY", "8")),
+    max_limit=int(os.getenv("LLM_MAX_CONCURRENCY", "64")),
+)
+retrieval_limiter = AdaptiveLimiter(
+    "retrieval",
+    initial=int(os.getenv("RETRIEVAL_INITIAL_CONCURRENCY", "4")),
+    max_limit=int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "16")),
+)
@@ -46,6 +46,22 @@ class ComplianceResult:
             'source_file': self.source_file
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "ComplianceResult":
+        """Inverse of to_dict"""
+        def split(value) -> list[str]:
+            return [v for v in str(value).split('; ') if v] if value else []
+
+        return cls(
+            feature_name=data['feature_name'],
+            compliance_flag=ComplianceFlag(data['compliance_flag']),
+            confidence_score=float(data['confidence_score']),
+            reasoning=data['reasoning'],
+            related_regulations=split(data.get('related_regulations')),
+            geo_regions=split(data.get('geo_regions')),
+            source_file=data.get('source_file', 'N/A')
+        )
+
 
 class DomainKnowledge:
     """Maps internal terminology to clear descriptions and provides regulation data."""
@@ -125,6 +141,38 @@ def generate_csv_output(results: list[ComplianceResult], output_path: str):
         writer.writerows([r.to_dict() for r in results])
 
 
+def generate_matrix_csv_output(matrix_results: list[tuple[str, dict[str, ComplianceResult]]], output_path: str,
+                               layout: str = "long"):
+    """
+    Generate CSV output for a feature x jurisdiction matrix run.
+    layout="long": one row per (feature, location) with the usual result columns.
+    layout="wide": one row per feature with every result column repeated per location.
+    """
+    if layout not in ("long", "wide"):
+        raise ValueError(f"Unknown matrix layout '{layout}', expected 'long' or 'wide'.")
+
+    if layout == "long":
+        rows = []
+        for feature_name, by_location in matrix_results:
+            for location, result in by_location.items():
+                rows.append({'location': location, **result.to_dict()})
+    else:
+        rows = []
+        for feature_name, by_location in matrix_results:
+            row = {'feature_name': feature_name}
+            for location, result in by_location.items():
+                for column, value in result.to_dict().items():
+                    if column != 'feature_name':
+                        row[f'{location} | {column}'] = value
+            rows.append(row)
+
+    with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
+        fieldnames = list(dict.fromkeys(k for row in rows for k in row))
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
 def load_regulations(base_path: Optional[str] = 'regulations', location: Optional[str] = None) -> Dict[str, str]:
     """
     Recursively loads all .txt files from the regulations directory.
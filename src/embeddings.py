@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import tarfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# Same all-MiniLM-L6-v2 ONNX export Chroma's default embedding function downloads, so embeddings stay
+# compatible with existing collections; we only add an int8 copy next to it.
+MODEL_DIR = Path.home() / ".cache" / "chroma" / "onnx_models" / "all-MiniLM-L6-v2" / "onnx"
+# archive and checksum Chroma 1.0.x downloads the model from (chromadb's ONNXMiniLM_L6_V2)
+MODEL_URL = "https://chroma-onnx-models.s3.amazonaws.com/all-MiniLM-L6-v2/onnx.tar.gz"
+MODEL_SHA256 = "913d7300ceae3b2dbc2c50d1de4baacab4be7b9380491c27fab7418616a16ec3"
+MAX_TOKENS = 256
+MAX_BATCH_SIZE = 64
+# dynamic batching: cap padded tokens per batch so a few long documents don't blow up a whole batch
+MAX_BATCH_TOKENS = 16384
+QUERY_CACHE_SIZE = 2048
+EMBEDDING_DIM = 384
+
+
+def download_model(model_dir: Path = MODEL_DIR):
+    """Download and unpack the all-MiniLM-L6-v2 ONNX export into model_dir, verifying the archive checksum."""
+    model_dir = Path(model_dir)
+    model_dir.parent.mkdir(parents=True, exist_ok=True)
+    archive = model_dir.parent / f"onnx.{os.getpid()}.tar.gz"
+    staging = model_dir.parent / f"extract.{os.getpid()}"
+    try:
+        digest = hashlib.sha256()
+        with urllib.request.urlopen(MODEL_URL, timeout=60) as resp, open(archive, "wb") as f:
+            while chunk := resp.read(1 << 20):
+                digest.update(chunk)
+                f.write(chunk)
+        if digest.hexdigest() != MODEL_SHA256:
+            raise ValueError(f"Checksum mismatch for {MODEL_URL}")
+        # the archive holds a single "onnx/" folder; unpack beside model_dir, then move it into place
+        with tarfile.open(archive, mode="r:gz") as tar:
+            tar.extractall(path=staging, filter="data")
+        if not model_dir.exists():
+            os.replace(staging / "onnx", model_dir)
+    finally:
+        archive.unlink(missing_ok=True)
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def default_num_threads() -> int:
+    """
+    Split the CPU between gunicorn workers: each worker process gets cpu_count / workers intra-op threads.
+    Worker count is read from WEB_CONCURRENCY (gunicorn's own default for --workers) or GUNICORN_WORKERS.
+    """
+    workers = int(os.getenv("GUNICORN_WORKERS") or os.getenv("WEB_CONCURRENCY") or 1)
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+class EmbeddingEngine:
+    """
+    Local CPU embedding engine: all-MiniLM-L6-v2 (int8-quantized by default) on ONNX Runtime.
+    Inputs are sorted by length and grouped into dynamically sized batches padded only to the longest input in
+    the batch (Chroma's default function pads everything to 256 tokens). Query embeddings are kept in an LRU.
+    Callable with a list of texts like a Chroma embedding function.
+    """
+
+    def __init__(self, model_dir: Path = MODEL_DIR, quantized: bool = True, num_threads: Optional[int] = None,
+                 cache_size: int = QUERY_CACHE_SIZE):
+        self.model_dir = Path(model_dir)
+        self.quantized = quantized
+        self.num_threads = num_threads or default_num_threads()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._session = None
+        self._tokenizer = None
+
+    def _model_path(self) -> Path:
+        fp32_path = self.model_dir / "model.onnx"
+        if not fp32_path.exists():
+            download_model(self.model_dir)
+        if not self.quantized:
+            return fp32_path
+        int8_path = self.model_dir / "model_int8.onnx"
+        if not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            tmp_path = int8_path.with_suffix(f".{os.getpid()}.tmp")
+            quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return int8_path
+
+    def _load(self):
+        if self._session is not None:
+            return
+        with self._init_lock:
+            if self._session is not None:
+                return
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+
+            model_path = self._model_path()
+            tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=MAX_TOKENS)
+            tokenizer.no_padding()
+
+            options = ort.SessionOptions()
+            options.log_severity_level = 3
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+            self._tokenizer = tokenizer
+            self._session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+    def _batches(self, encodings: list) -> list[list[int]]:
+        """Group input positions into batches, longest-first, bounded by MAX_BATCH_SIZE and MAX_BATCH_TOKENS."""
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i].ids), reverse=True)
+        batches, current = [], []
+        for i in order:
+            # sorted longest-first, so the first item of a batch sets its padded length
+            longest = len(encodings[current[0]].ids) if current else len(encodings[i].ids)
+            if current and (len(current) >= MAX_BATCH_SIZE or longest * (len(current) + 1) > MAX_BATCH_TOKENS):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        self._load()
+        encodings = self._tokenizer.encode_batch(texts)
+        out = None
+        for batch in self._batches(encodings):
+            length = max(len(encodings[i].ids) for i in batch)
+            input_ids = np.zeros((len(batch), length), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), length), dtype=np.int64)
+            for row, i in enumerate(batch):
+                ids = encodings[i].ids
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+            last_hidden_state = self._session.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            })[0]
+            # mean pooling over real tokens, then L2-normalize (same as Chroma's default function)
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            if out is None:
+                out = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[batch] = pooled
+        return out
+
+    def encode(self, texts: list[str], use_cache: bool = False) -> np.ndarray:
+        """Embed texts, returning a (len(texts), dim) float32 array in input order."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        if not use_cache:
+            return self._encode(texts)
+
+        cached = {}
+        with self._cache_lock:
+            for text in texts:
+                if text in self._cache:
+                    self._cache.move_to_end(text)
+                    cached[text] = self._cache[text]
+        missing = list(dict.fromkeys(t for t in texts if t not in cached))
+        if missing:
+            for text, vector in zip(missing, self._encode(missing)):
+                cached[text] = vector
+            with self._cache_lock:
+                for text in missing:
+                    self._cache[text] = cached[text]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.vstack([cached[t] for t in texts])
+
+    def prefetch(self, texts: list[str]):
+        """
+        Embed upcoming queries in batches ahead of their one-at-a-time lookups. Only as many unique texts as the
+        LRU holds are embedded, so none is evicted before it is used.
+        """
+        self.encode(list(dict.fromkeys(texts))[:self.cache_size], use_cache=True)
+
+    def __call__(self, input: list[str]) -> list[np.ndarray]:
+        """Chroma embedding-function interface; used for queries, so results go through the LRU."""
+        return list(self.encode(input, use_cache=True))
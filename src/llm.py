@@ -1,16 +1,44 @@
 from abc import ABC, abstractmethod
+import json
 import os
-from openai import OpenAI
-from google import genai
+import random
+import time
 from typing import Optional
 
+def _strip_keys(schema, *keys):
+    """Return a copy of a JSON Schema without the given keywords (at any depth)."""
+    if isinstance(schema, dict):
+        return {k: _strip_keys(v, *keys) for k, v in schema.items() if k not in keys}
+    if isinstance(schema, list):
+        return [_strip_keys(v, *keys) for v in schema]
+    return schema
+
+
+# output token budget per JSON object in the response (one verdict, one routing decision, ...)
+MAX_TOKENS_PER_OBJECT = 500
+
+
+def _count_objects(schema) -> int:
+    """Number of innermost object schemas, e.g. 5 for a matrix schema with 5 verdicts."""
+    if not isinstance(schema, dict):
+        return 0
+    nested = sum(_count_objects(v) for v in schema.get("properties", {}).values())
+    nested += _count_objects(schema.get("items"))
+    if nested:
+        return nested
+    return 1 if schema.get("type") == "object" else 0
+
+
 # interface for LLM providers
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
 
     @abstractmethod
-    def generate_json_response(self, prompt: str) -> str:
-        """Generate a JSON response from the LLM."""
+    def generate_json_response(self, prompt: str, schema: Optional[dict] = None) -> str:
+        """
+        Generate a JSON response from the LLM.
+        If `schema` (a JSON Schema object) is given, the provider constrains decoding to it.
+        """
         pass
 
     @abstractmethod
@@ -23,11 +51,15 @@ class GeminiProvider(LLMProvider):
     """Google Gemini API provider."""
 
     def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash"):
+        # provider SDKs are imported lazily so importing this module (or using the other
+        # provider) doesn't pay for them
+        from google import genai
+        self._genai = genai
         self.client = genai.Client(
             api_key=api_key or os.getenv("GEMINI_API_KEY"))
         self.model = model
 
-    def generate_json_response(self, prompt: str) -> str:
+    def generate_json_response(self, prompt: str, schema: Optional[dict] = None) -> str:
         """Generate a response, ensuring it's valid JSON."""
         model_instance = self.client
         
@@ -35,8 +67,9 @@ class GeminiProvider(LLMProvider):
         response = model_instance.models.generate_content(
             model=self.model,
             contents=prompt,
-            config=genai.types.GenerateContentConfig(
+            config=self._genai.types.GenerateContentConfig(
                 response_mime_type="application/json",
+                response_schema=_strip_keys(schema, "additionalProperties") if schema else None,
                 temperature=0.1,
             ),
         )
@@ -49,20 +82,81 @@ class GeminiProvider(LLMProvider):
 class OpenAIProvider(LLMProvider):
     """OpenAI API provider."""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini"):
+        from openai import OpenAI
         self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
         self.model = model
 
-    def generate_json_response(self, prompt: str) -> str:
-        """Generate a response with JSON mode enabled."""
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=500,
-            response_format={"type": "json_object"}
-        )
-        return response.choices[0].message.content.strip()
+    def generate_json_response(self, prompt: str, schema: Optional[dict] = None) -> str:
+        """Generate a response with JSON mode enabled (strict structured output when a schema is given)."""
+        if schema:
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "strict": True, "schema": schema},
+            }
+        else:
+            response_format = {"type": "json_object"}
+        # budget scales with the number of objects requested (a matrix response holds one verdict per location);
+        # a truncated response is retried once with twice the budget rather than returned as unparseable JSON
+        max_tokens = MAX_TOKENS_PER_OBJECT * max(1, _count_objects(schema))
+        for attempt in range(2):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                max_tokens=max_tokens,
+                response_format=response_format
+            )
+            choice = response.choices[0]
+            if choice.finish_reason != "length":
+                return choice.message.content.strip()
+            max_tokens *= 2
+        raise ValueError(f"OpenAI response truncated at {max_tokens // 2} tokens")
+
+    def get_model_name(self) -> str:
+        return f"OpenAI/{self.model}"
+
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider for load testing: sleeps for a randomized latency and returns a response that satisfies
+    the requested schema (or a generic verdict). Latency is log-normal around `latency_ms`.
+    """
+
+    DEFAULT_RESPONSE = {
+        "compliance_flag": "UNCERTAIN",
+        "confidence_score": 0.5,
+        "reasoning": "Stub response.",
+        "related_regulations": [],
+        "geo_regions": [],
+        "source_file": "N/A",
+    }
+
+    def __init__(self, latency_ms: Optional[float] = None, jitter: Optional[float] = None, model: str = "stub"):
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.getenv("STUB_LATENCY_MS", "800"))
+        self.jitter = float(jitter if jitter is not None else os.getenv("STUB_LATENCY_JITTER", "0.3"))
+        self.model = model
+
+    def _sample(self, schema: dict):
+        kind = schema.get("type")
+        if "enum" in schema:
+            return random.choice(schema["enum"])
+        if kind == "object":
+            return {key: self._sample(sub) for key, sub in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self._sample(schema.get("items", {"type": "string"}))]
+        if kind == "number":
+            return round(random.random(), 2)
+        if kind == "integer":
+            return random.randint(0, 10)
+        if kind == "boolean":
+            return random.random() < 0.5
+        return "stub"
+
+    def generate_json_response(self, prompt: str, schema: Optional[dict] = None) -> str:
+        if self.latency_ms > 0:
+            time.sleep(random.lognormvariate(0, self.jitter) * self.latency_ms / 1000)
+        return json.dumps(self._sample(schema) if schema else self.DEFAULT_RESPONSE)
 
     def get_model_name(self) -> str:
-        return f"OpenAI/{self.model}"
\ No newline at end of file
+        return f"Stub/{self.model}"
\ No newline at end of file
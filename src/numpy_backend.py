@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from .rag_system import COLLECTION_NAMES, RetrievalBackend, get_collection
+
+DEFAULT_INDEX_DIR = "./vector_index"
+UPCAST_BLOCK_ROWS = 65536
+# how often a worker re-checks that the exported index still matches the Chroma collections
+FINGERPRINT_CHECK_SECONDS = float(os.getenv("VECTOR_INDEX_CHECK_SECONDS", "30"))
+
+
+def collections_fingerprint() -> str:
+    """
+    Fingerprint of the chunks currently in Chroma. Ingestion assigns fresh ids to every added chunk,
+    so any reindex / sync (from any process) changes it.
+    """
+    digest = hashlib.sha256()
+    for name in COLLECTION_NAMES:
+        collection = get_collection(name)
+        ids = sorted(collection.get(include=[])["ids"]) if collection is not None else []
+        digest.update(f"{name}:{','.join(ids)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """One loaded export of the index; replaced as a whole, so a query never mixes two exports."""
+    matrix: np.ndarray
+    ranges: dict[str, tuple[int, int]]  # collection -> [start, end) rows of the matrix
+    documents: list[str]
+    sources: list[str]
+    fingerprint: str | None
+
+
+class NumpyBackend(RetrievalBackend):
+    """
+    Exact in-process vector search for small corpora.
+    All chunk embeddings live in one contiguous, L2-normalized matrix (memory-mapped from `index_dir`), with the
+    rows of each collection stored as one contiguous block. A batch of queries is scored against every chunk with
+    a single matmul; distances are reported as squared L2 between unit vectors (2 - 2 * cosine), which is what
+    Chroma's default "l2" space returns for the normalized default embeddings, so hits are interchangeable.
+
+    The index is exported from the Chroma collections on first use and again on refresh(). The export stores
+    a fingerprint of the collections; it is re-checked every FINGERPRINT_CHECK_SECONDS and the index rebuilt on
+    a mismatch, so a reindex / reanalyze run in another process is picked up.
+    """
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, dtype: str = "float32"):
+        self.index_dir = index_dir
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._snapshot: IndexSnapshot | None = None
+        self._checked_at = 0.0
+
+    def _paths(self):
+        return (os.path.join(self.index_dir, "embeddings.npy"),
+                os.path.join(self.index_dir, "chunks.json"))
+
+    def build(self):
+        """Export every Chroma collection into the on-disk matrix + chunk metadata."""
+        vectors, collection_ids, documents, sources = [], [], [], []
+        names = list(COLLECTION_NAMES)
+        fingerprint = collections_fingerprint()
+        for collection_id, name in enumerate(names):
+            res = get_collection(name).get(include=["embeddings", "documents", "metadatas"])
+            if len(res["ids"]) == 0:
+                continue
+            vectors.append(np.asarray(res["embeddings"], dtype=np.float32))
+            collection_ids.extend([collection_id] * len(res["ids"]))
+            documents.extend(doc or "" for doc in res["documents"])
+            sources.extend((meta or {}).get("source") for meta in res["metadatas"])
+
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = (matrix / np.where(norms == 0, 1, norms)).astype(self.dtype)
+
+        embeddings_path, chunks_path = self._paths()
+        os.makedirs(self.index_dir, exist_ok=True)
+        # write-then-rename, so other workers never map a half-written file (existing maps keep the old inode)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(embeddings_path + suffix, "wb") as f:
+            np.save(f, matrix)
+        with open(chunks_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"collections": names, "collection_ids": collection_ids,
+                       "documents": documents, "sources": sources, "fingerprint": fingerprint}, f)
+        os.replace(embeddings_path + suffix, embeddings_path)
+        os.replace(chunks_path + suffix, chunks_path)
+        print(f"Built vector index with {len(documents)} chunks in {self.index_dir}")
+
+    def _load(self):
+        embeddings_path, chunks_path = self._paths()
+        if not (os.path.exists(embeddings_path) and os.path.exists(chunks_path)):
+            self.build()
+        matrix = np.load(embeddings_path, mmap_mode="r")
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        collection_ids = np.asarray(chunks["collection_ids"], dtype=np.int32)
+        # rows are grouped by collection, so each collection is a [start, end) slice of the matrix
+        ranges = {}
+        for collection_id, name in enumerate(chunks["collections"]):
+            rows = np.flatnonzero(collection_ids == collection_id)
+            ranges[name] = (int(rows[0]), int(rows[-1]) + 1) if len(rows) else (0, 0)
+        # a single assignment, so concurrent queries see either the old or the new export
+        self._snapshot = IndexSnapshot(matrix, ranges, chunks["documents"], chunks["sources"], chunks.get("fingerprint"))
+
+    def _ensure_current(self):
+        """Load the index on first use; afterwards periodically rebuild it if Chroma changed underneath it."""
+        if self._snapshot is not None and time.time() - self._checked_at < FINGERPRINT_CHECK_SECONDS:
+            return
+        with self._lock:
+            if self._snapshot is None:
+                self._load()
+            if time.time() - self._checked_at < FINGERPRINT_CHECK_SECONDS:
+                return
+            self._checked_at = time.time()
+            if collections_fingerprint() != self._snapshot.fingerprint:
+                print("Vector index is out of date with the Chroma collections, rebuilding")
+                self.build()
+                self._load()
+
+    def refresh(self):
+        with self._lock:
+            self.build()
+            self._load()
+
+    def query(self, collection_names: list[str], query_embeddings, top_k: int = 5) -> list[dict]:
+        self._ensure_current()
+        index = self._snapshot
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        results = [{} for _ in range(len(queries))]
+        known = [name for name in collection_names if name in index.ranges]
+        for name in collection_names:
+            if name not in index.ranges:
+                for per_query in results:
+                    per_query[name] = [{"error": "Collection not found"}]
+        if not known or len(queries) == 0:
+            return results
+        if index.matrix.shape[0] == 0:
+            # nothing ingested yet (build() wrote a (0, 0) matrix)
+            for per_query in results:
+                per_query.update({name: [] for name in known})
+            return results
+
+        # one matmul for the whole batch against every chunk: (num_chunks, num_queries).
+        # float16 storage is upcast in row blocks since numpy has no BLAS path for float16 matmul.
+        if index.matrix.dtype == np.float32:
+            similarities = index.matrix @ queries.T
+        else:
+            similarities = np.empty((index.matrix.shape[0], len(queries)), dtype=np.float32)
+            for start in range(0, index.matrix.shape[0], UPCAST_BLOCK_ROWS):
+                block = index.matrix[start:start + UPCAST_BLOCK_ROWS].astype(np.float32)
+                similarities[start:start + UPCAST_BLOCK_ROWS] = block @ queries.T
+        distances = 2.0 - 2.0 * similarities
+
+        for name in known:
+            start, end = index.ranges[name]
+            block = distances[start:end]
+            k = min(top_k, end - start)
+            if k == 0:
+                for per_query in results:
+                    per_query[name] = []
+                continue
+            # top-k per query column, then sort those k by distance
+            top = np.argpartition(block, k - 1, axis=0)[:k]
+            for i, per_query in enumerate(results):
+                rows = top[:, i][np.argsort(block[top[:, i], i])]
+                per_query[name] = [
+                    {
+                        "doc_snippet": index.documents[start + r],
+                        "source": index.sources[start + r],
+                        "distance": float(block[r, i]),
+                    }
+                    for r in rows
+                ]
+        return results
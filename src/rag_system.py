@@ -1,15 +1,95 @@
-import chromadb
 import os
+import threading
 import uuid
+from abc import ABC, abstractmethod
 
-client = chromadb.PersistentClient(path="./chroma_db")
+CHROMA_PATH = "./chroma_db"
+
+# Each collection assigned to each regulation (regulation directory -> collection name)
+COLLECTION_NAMES = {
+    "CS_CS_HB_3": "CS_CS_HB_3",
+    "EU_DSA": "EU_DSA_Regulations",
+    "SB976_POKSMAA": "SB976_POKSMAA",
+    "UTAH_SocialMediaRegulation": "UTAH_SocialMediaRegulation",
+    "US_reporting_child_sexual_abuse": "US_reporting_child_sexual_abuse",
+}
+
+# The Chroma client, its collections and the embedding function are built on first use rather
+# than at import time, so CLI startup and web workers don't pay for them until a query runs.
+_client = None
+_collections = {}
+_embedding_function = None
+_init_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _client
+
+
+def get_collection(name: str):
+    """Return the Chroma collection for a regulation directory name, or None if unknown."""
+    collection_name = COLLECTION_NAMES.get(name)
+    if collection_name is None:
+        return None
+    collection = _collections.get(name)
+    if collection is None:
+        client = get_client()
+        with _init_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = client.get_or_create_collection(name=collection_name)
+                _collections[name] = collection
+    return collection
+
+
+def get_embedding_function():
+    """
+    Embedding function shared by ingestion and queries, chosen by the EMBEDDING_ENGINE environment variable:
+    "chroma" (default, Chroma's default embedding function), "onnx-int8" (local quantized engine from
+    src/embeddings.py) or "onnx" (same engine, fp32 model). The bundled chroma_db/ was embedded with "chroma";
+    switch engines only after `main.py reindex` with the same EMBEDDING_ENGINE, since queries and stored
+    document embeddings must come from the same model.
+    A query is embedded once and reused across every collection instead of re-embedding inside each collection.query.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _init_lock:
+            if _embedding_function is None:
+                engine = os.getenv("EMBEDDING_ENGINE", "chroma").lower()
+                if engine in ("onnx-int8", "onnx"):
+                    from .embeddings import EmbeddingEngine
+                    _embedding_function = EmbeddingEngine(quantized=engine == "onnx-int8")
+                elif engine == "chroma":
+                    from chromadb.utils import embedding_functions
+                    _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+                else:
+                    raise ValueError(f"Unknown EMBEDDING_ENGINE '{engine}', expected 'chroma', 'onnx-int8' or 'onnx'.")
+    return _embedding_function
+
+
+def prefetch_query_embeddings(query_texts: list[str]):
+    """
+    Batch-embed queries that are about to be issued one by one (see EmbeddingEngine.prefetch).
+    No-op for embedding functions without a query cache, such as Chroma's default.
+    """
+    embedding_function = get_embedding_function()
+    if hasattr(embedding_function, "prefetch"):
+        embedding_function.prefetch(query_texts)
+
+
+def _embed_documents(documents: list[str]):
+    embedding_function = get_embedding_function()
+    if hasattr(embedding_function, "encode"):
+        # documents are embedded once, keep them out of the query LRU
+        return embedding_function.encode(documents)
+    return embedding_function(documents)
 
-# Each collection assigned to each regulation
-CS_CS_HB_3_collection = client.get_or_create_collection(name="CS_CS_HB_3")
-EU_DSA_Regulations_collection = client.get_or_create_collection(name="EU_DSA_Regulations")
-SB976_POKSMAA_collection = client.get_or_create_collection(name="SB976_POKSMAA")
-UTAH_SocialMediaRegulation_collection = client.get_or_create_collection(name="UTAH_SocialMediaRegulation")
-US_reporting_child_sexual_abuse_collection = client.get_or_create_collection(name="US_reporting_child_sexual_abuse")
 
 # open all txt files in CS_CS_HB_3 directory and put them into a list[str]
 # CS_CS_HB_3_policies = []
@@ -122,43 +202,164 @@ US_reporting_child_sexual_abuse_collection = client.get_or_create_collection(nam
 #             results[name] = [{"error": str(e)}]
 #     return results
 
+def _hits_from_result(res, i: int = 0) -> list[dict]:
+    return [
+        {
+            "doc_snippet": doc if doc else "",
+            "source": (meta or {}).get("source"),
+            "distance": dist,
+        }
+        for doc, meta, dist in zip(
+            (res.get("documents") or [[]])[i],
+            (res.get("metadatas") or [[]])[i],
+            (res.get("distances") or [[]])[i],
+        )
+    ]
+
+
+# interface for retrieval backends behind query_collections
+class RetrievalBackend(ABC):
+    """
+    Nearest-neighbour search over the regulation collections.
+    query() takes already-embedded queries and returns one {collection_name: hits} dict per query,
+    where each hit is {"doc_snippet", "source", "distance"} (or {"error"} for a collection that doesn't exist).
+    Search failures raise, so callers (and the retrieval concurrency limiter) see them.
+    """
+
+    @abstractmethod
+    def query(self, collection_names: list[str], query_embeddings, top_k: int = 5) -> list[dict]:
+        pass
+
+    def refresh(self):
+        """Called after the Chroma collections were modified (e.g. by sync_regulation_files)."""
+        pass
+
+
+class ChromaBackend(RetrievalBackend):
+    """Queries the Chroma collections directly (HNSW index + SQLite metadata)."""
+
+    def query(self, collection_names: list[str], query_embeddings, top_k: int = 5) -> list[dict]:
+        results = [{} for _ in query_embeddings]
+        for name in collection_names:
+            collection = get_collection(name)
+            if not collection:
+                for per_query in results:
+                    per_query[name] = [{"error": "Collection not found"}]
+                continue
+            res = collection.query(query_embeddings=query_embeddings, n_results=top_k)
+            for i, per_query in enumerate(results):
+                per_query[name] = _hits_from_result(res, i)
+        return results
+
+
+_backend = None
+
+
+def get_backend() -> RetrievalBackend:
+    """
+    The active retrieval backend, chosen by the RETRIEVAL_BACKEND environment variable:
+    "chroma" (default) or "numpy" (in-process exact search, see src/numpy_backend.py; storage precision
+    set by VECTOR_INDEX_DTYPE=float32|float16).
+    """
+    global _backend
+    if _backend is None:
+        with _init_lock:
+            if _backend is None:
+                name = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+                if name == "numpy":
+                    from .numpy_backend import NumpyBackend
+                    _backend = NumpyBackend(dtype=os.getenv("VECTOR_INDEX_DTYPE", "float32"))
+                elif name == "chroma":
+                    _backend = ChromaBackend()
+                else:
+                    raise ValueError(f"Unknown RETRIEVAL_BACKEND '{name}', expected 'chroma' or 'numpy'.")
+    return _backend
+
+
+def set_backend(backend: RetrievalBackend):
+    global _backend
+    _backend = backend
+
+
 def query_collections(collection_names: list[str], query_text: str, top_k: int = 5):
-    collections_map = {
-        "CS_CS_HB_3": CS_CS_HB_3_collection,
-        "EU_DSA": EU_DSA_Regulations_collection,
-        "SB976_POKSMAA": SB976_POKSMAA_collection,
-        "UTAH_SocialMediaRegulation": UTAH_SocialMediaRegulation_collection,
-        "US_reporting_child_sexual_abuse": US_reporting_child_sexual_abuse_collection,
-    }
+    return query_collections_batch(collection_names, [query_text], top_k)[0]
+
 
+def query_collections_batch(collection_names: list[str], query_texts: list[str], top_k: int = 5) -> list[dict]:
+    """
+    Batched variant of query_collections for many queries against many collections.
+    Every query is embedded exactly once, then the backend searches all collections with
+    all the embeddings. Returns one {collection_name: hits} dict per query text, in input order.
+    Embedding and search errors propagate to the caller.
+    """
     # If no list provided (empty), default to all collections
     if not collection_names:
-        collection_names = list(collections_map.keys())
+        collection_names = list(COLLECTION_NAMES.keys())
+
+    if not query_texts:
+        return []
+
+    query_embeddings = get_embedding_function()(list(query_texts))
+    return get_backend().query(collection_names, query_embeddings, top_k)
 
-    results = {}
-    for name in collection_names:
-        collection = collections_map.get(name)
-        if not collection:
-            results[name] = [{"error": "Collection not found"}]
+
+def sync_regulation_files(directory: str, filenames: list[str], base_path: str = "regulations"):
+    """
+    Re-ingest the given regulation files of one directory into its collection: existing chunks from those
+    files are deleted and files still on disk are added back with their current content.
+    """
+    collection = get_collection(directory)
+    if collection is None:
+        print(f"Warning: no collection for regulation directory '{directory}', skipping sync.")
+        return
+    documents, metadatas = [], []
+    for filename in filenames:
+        collection.delete(where={"source": filename})
+        file_path = os.path.join(base_path, directory, filename)
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                documents.append(f"{filename}\n{file.read()}")
+            metadatas.append({"source": filename})
+    if documents:
+        collection.add(
+            ids=[str(uuid.uuid4()) for _ in documents],
+            documents=documents,
+            embeddings=_embed_documents(documents),
+            metadatas=metadatas
+        )
+    get_backend().refresh()
+
+
+def reindex_regulations(base_path: str = "regulations"):
+    """
+    Rebuild every collection from the regulation files on disk with the current embedding function
+    (one document per .txt file, prefixed with its filename, as in the original ingestion).
+    """
+    for directory in COLLECTION_NAMES:
+        dir_path = os.path.join(base_path, directory)
+        if not os.path.isdir(dir_path):
+            print(f"Warning: regulation directory '{dir_path}' not found, skipping.")
             continue
-        try:
-            res = collection.query(query_texts=[query_text], n_results=top_k)
-            hits = [
-                {
-                    "doc_snippet": doc if doc else "",
-                    "source": (meta or {}).get("source"),
-                    "distance": dist,
-                }
-                for doc, meta, dist in zip(
-                    res.get("documents", [[]])[0],
-                    res.get("metadatas", [[]])[0],
-                    res.get("distances", [[]])[0],
-                )
-            ]
-            results[name] = hits
-        except Exception as e:
-            results[name] = [{"error": str(e)}]
-    return results
+        documents, metadatas = [], []
+        for filename in sorted(os.listdir(dir_path)):
+            if filename.endswith(".txt"):
+                with open(os.path.join(dir_path, filename), "r", encoding="utf-8") as file:
+                    documents.append(f"{filename}\n{file.read()}")
+                metadatas.append({"source": filename})
+
+        collection = get_collection(directory)
+        existing = collection.get(include=[])["ids"]
+        if existing:
+            collection.delete(ids=existing)
+        if documents:
+            collection.add(
+                ids=[str(uuid.uuid4()) for _ in documents],
+                documents=documents,
+                embeddings=_embed_documents(documents),
+                metadatas=metadatas
+            )
+        print(f"Indexed {len(documents)} documents into {COLLECTION_NAMES[directory]}")
+    get_backend().refresh()
 
 sample_features = [
     {
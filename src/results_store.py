@@ -0,0 +1,297 @@
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .data_handler import ComplianceFlag, ComplianceResult
+from .retrieval_index import PROJECT_ROOT
+from .singleflight import feature_flight_key
+
+DEFAULT_STORE_PATH = os.path.join(PROJECT_ROOT, "outputs", "results.sqlite3")
+# columns query() can sort by
+SORT_COLUMNS = ("analyzed_at", "feature_name", "compliance_flag", "confidence_score", "location")
+# columns run_page() can sort by; position is the input row order
+RUN_SORT_COLUMNS = ("position", "feature_name", "compliance_flag", "confidence_score")
+
+
+def content_hash(feature_name: str, feature_description: str, location: Optional[str]) -> str:
+    """Hash of the normalized feature content (same normalization as single-flight coalescing)."""
+    return hashlib.sha256("\x1f".join(feature_flight_key(feature_name, feature_description, location))
+                          .encode("utf-8")).hexdigest()
+
+
+def corpus_version(corpus: dict[tuple[str, str], tuple[str, float]], directories: Optional[list[str]] = None) -> str:
+    """
+    Version of the regulation corpus a verdict was based on: a hash over the file hashes from scan_corpus(),
+    limited to `directories` when given, so editing one jurisdiction's files doesn't invalidate the others.
+    """
+    digest = hashlib.sha256()
+    for (directory, filename), (sha, _) in sorted(corpus.items()):
+        if directories is None or directory in directories:
+            digest.update(f"{directory}/{filename}:{sha}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResultsStore:
+    """
+    Embedded SQLite store of every ComplianceResult, keyed by feature-content hash + model version + corpus
+    version, with indexes on flag, related regulation and geo region for querying historical results.
+    A stored verdict is reused only when all three match, so a new model or changed regulations force a re-run.
+
+    It also keeps the rows of each web run (one upload or single-feature analysis, in input order) so the
+    results page can fetch them a page at a time, together with the reviewer's ticks and reasoning edits.
+    Runs older than the retention period are removed with delete_runs_before().
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "CREATE TABLE IF NOT EXISTS results ("
+                " id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL, model_version TEXT NOT NULL,"
+                " corpus_version TEXT NOT NULL, feature_name TEXT NOT NULL, feature_description TEXT NOT NULL,"
+                " location TEXT, compliance_flag TEXT NOT NULL, confidence_score REAL NOT NULL, reasoning TEXT NOT NULL,"
+                " related_regulations TEXT NOT NULL, geo_regions TEXT NOT NULL, source_file TEXT NOT NULL,"
+                " analyzed_at REAL NOT NULL,"
+                " UNIQUE (content_hash, model_version, corpus_version));"
+                "CREATE INDEX IF NOT EXISTS idx_results_flag ON results(compliance_flag);"
+                "CREATE INDEX IF NOT EXISTS idx_results_analyzed_at ON results(analyzed_at);"
+                "CREATE TABLE IF NOT EXISTS result_regulations ("
+                " result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,"
+                " regulation TEXT NOT NULL COLLATE NOCASE, PRIMARY KEY (result_id, regulation));"
+                "CREATE INDEX IF NOT EXISTS idx_result_regulations ON result_regulations(regulation);"
+                "CREATE TABLE IF NOT EXISTS result_regions ("
+                " result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,"
+                " region TEXT NOT NULL COLLATE NOCASE, PRIMARY KEY (result_id, region));"
+                "CREATE INDEX IF NOT EXISTS idx_result_regions ON result_regions(region);"
+                "CREATE TABLE IF NOT EXISTS run_results ("
+                " run_id TEXT NOT NULL, position INTEGER NOT NULL, feature_name TEXT NOT NULL,"
+                " compliance_flag TEXT NOT NULL, confidence_score REAL NOT NULL, reasoning TEXT NOT NULL,"
+                " related_regulations TEXT NOT NULL, geo_regions TEXT NOT NULL, source_file TEXT NOT NULL,"
+                " reviewed INTEGER NOT NULL DEFAULT 0, edited_reasoning TEXT,"
+                " PRIMARY KEY (run_id, position));"
+                "CREATE INDEX IF NOT EXISTS idx_run_results_flag ON run_results(run_id, compliance_flag);"
+                "CREATE TABLE IF NOT EXISTS run_result_regions ("
+                " run_id TEXT NOT NULL, position INTEGER NOT NULL, region TEXT NOT NULL COLLATE NOCASE,"
+                " PRIMARY KEY (run_id, position, region));"
+                "CREATE INDEX IF NOT EXISTS idx_run_result_regions ON run_result_regions(run_id, region);"
+                "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, created_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs(created_at);"
+            )
+            # stores created before review state was kept server-side
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(run_results)")}
+            if "reviewed" not in columns:
+                conn.execute("ALTER TABLE run_results ADD COLUMN reviewed INTEGER NOT NULL DEFAULT 0")
+            if "edited_reasoning" not in columns:
+                conn.execute("ALTER TABLE run_results ADD COLUMN edited_reasoning TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, feature_name: str, feature_description: str, location: Optional[str],
+            model_version: str, corpus_version: str) -> Optional[ComplianceResult]:
+        """Stored verdict for this feature content, model and corpus version, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM results WHERE content_hash = ? AND model_version = ? AND corpus_version = ?",
+                (content_hash(feature_name, feature_description, location), model_version, corpus_version)
+            ).fetchone()
+        if row is None:
+            return None
+        result = ComplianceResult.from_dict(dict(row))
+        # the caller's spelling of the name wins over the one stored with the verdict
+        result.feature_name = feature_name
+        return result
+
+    def put(self, result: ComplianceResult, feature_description: str, location: Optional[str],
+            model_version: str, corpus_version: str):
+        """Store (or replace) the verdict for this feature content, model and corpus version."""
+        row = result.to_dict()
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM results WHERE content_hash = ? AND model_version = ? AND corpus_version = ?",
+                (content_hash(result.feature_name, feature_description, location), model_version, corpus_version)
+            )
+            result_id = conn.execute(
+                "INSERT INTO results (content_hash, model_version, corpus_version, feature_name, feature_description,"
+                " location, compliance_flag, confidence_score, reasoning, related_regulations, geo_regions,"
+                " source_file, analyzed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash(result.feature_name, feature_description, location), model_version, corpus_version,
+                 result.feature_name, feature_description, location, row["compliance_flag"],
+                 row["confidence_score"], row["reasoning"], row["related_regulations"], row["geo_regions"],
+                 row["source_file"], time.time())
+            ).lastrowid
+            conn.executemany("INSERT OR IGNORE INTO result_regulations (result_id, regulation) VALUES (?, ?)",
+                             [(result_id, r) for r in result.related_regulations])
+            conn.executemany("INSERT OR IGNORE INTO result_regions (result_id, region) VALUES (?, ?)",
+                             [(result_id, g) for g in result.geo_regions])
+
+    def _where(self, flag: Optional[str], regulation: Optional[str], region: Optional[str],
+               location: Optional[str], feature: Optional[str], model_version: Optional[str],
+               since: Optional[float]) -> tuple[str, list]:
+        clauses, params = [], []
+        if flag:
+            clauses.append("compliance_flag = ?")
+            params.append(ComplianceFlag(flag.upper()).value)
+        if regulation:
+            clauses.append("id IN (SELECT result_id FROM result_regulations WHERE regulation = ?)")
+            params.append(regulation)
+        if region:
+            clauses.append("id IN (SELECT result_id FROM result_regions WHERE region = ?)")
+            params.append(region)
+        if location:
+            clauses.append("location = ?")
+            params.append(location)
+        if feature:
+            clauses.append("feature_name LIKE ?")
+            params.append(f"%{feature}%")
+        if model_version:
+            clauses.append("model_version = ?")
+            params.append(model_version)
+        if since is not None:
+            clauses.append("analyzed_at >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, flag: Optional[str] = None, regulation: Optional[str] = None, region: Optional[str] = None,
+              location: Optional[str] = None, feature: Optional[str] = None, model_version: Optional[str] = None,
+              since: Optional[float] = None, sort: str = "analyzed_at", descending: bool = True,
+              limit: Optional[int] = 100, offset: int = 0) -> Iterator[dict]:
+        """
+        Filter historical results. `regulation` and `region` match one entry of the result's list (case-insensitive),
+        `feature` is a substring of the feature name, `since` a unix timestamp. Yields one dict per stored result.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}', expected one of {', '.join(SORT_COLUMNS)}.")
+        where, params = self._where(flag, regulation, region, location, feature, model_version, since)
+        sql = (f"SELECT * FROM results{where} ORDER BY {sort} {'DESC' if descending else 'ASC'}, id"
+               f" LIMIT ? OFFSET ?")
+        with self._connect() as conn:
+            for row in conn.execute(sql, params + [-1 if limit is None else limit, offset]):
+                yield dict(row)
+
+    def count(self, flag: Optional[str] = None, regulation: Optional[str] = None, region: Optional[str] = None,
+              location: Optional[str] = None, feature: Optional[str] = None, model_version: Optional[str] = None,
+              since: Optional[float] = None) -> int:
+        """Number of stored results matching the same filters as query()."""
+        where, params = self._where(flag, regulation, region, location, feature, model_version, since)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM results{where}", params).fetchone()[0]
+
+
+    def save_run(self, run_id: str, results: list[ComplianceResult]):
+        """Store the rows of one run in input order (failed analyses included)."""
+        rows = [(run_id, position, *result.to_dict().values()) for position, result in enumerate(results)]
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO runs (run_id, created_at) VALUES (?, ?)", (run_id, time.time()))
+            conn.executemany(
+                "INSERT INTO run_results (run_id, position, feature_name, compliance_flag, confidence_score, reasoning,"
+                " related_regulations, geo_regions, source_file) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO run_result_regions (run_id, position, region) VALUES (?, ?, ?)",
+                [(run_id, position, region) for position, result in enumerate(results) for region in result.geo_regions]
+            )
+
+    def update_run_results(self, run_id: str, results: dict[int, ComplianceResult]) -> int:
+        """
+        Replace the verdicts of some rows of a run ({position: result}), e.g. after `main.py reanalyze` rewrote
+        them in the run's CSV. Their review tick and reasoning edit are cleared, since they were about the old
+        verdict. Returns the number of rows updated (0 if there is no such run).
+        """
+        updated = 0
+        with self._connect() as conn:
+            for position, result in results.items():
+                row = result.to_dict()
+                updated += conn.execute(
+                    "UPDATE run_results SET compliance_flag = ?, confidence_score = ?, reasoning = ?,"
+                    " related_regulations = ?, geo_regions = ?, source_file = ?, reviewed = 0, edited_reasoning = NULL"
+                    " WHERE run_id = ? AND position = ?",
+                    (row["compliance_flag"], row["confidence_score"], row["reasoning"], row["related_regulations"],
+                     row["geo_regions"], row["source_file"], run_id, position)
+                ).rowcount
+                conn.execute("DELETE FROM run_result_regions WHERE run_id = ? AND position = ?", (run_id, position))
+                conn.executemany("INSERT OR IGNORE INTO run_result_regions (run_id, position, region) VALUES (?, ?, ?)",
+                                 [(run_id, position, region) for region in result.geo_regions])
+        return updated
+
+    def run_page(self, run_id: str, flags: Optional[list[str]] = None, regions: Optional[list[str]] = None,
+                 sort: str = "position", descending: bool = False, limit: int = 50,
+                 offset: int = 0) -> tuple[int, list[dict]]:
+        """
+        One page of a run's rows, filtered to any of `flags` and any of `regions` (case-insensitive).
+        Returns (number of matching rows, rows on this page).
+        """
+        if sort not in RUN_SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}', expected one of {', '.join(RUN_SORT_COLUMNS)}.")
+        where, params = " WHERE run_id = ?", [run_id]
+        if flags:
+            where += f" AND compliance_flag IN ({','.join('?' * len(flags))})"
+            params += [ComplianceFlag(flag.upper()).value for flag in flags]
+        if regions:
+            where += (" AND position IN (SELECT position FROM run_result_regions"
+                      f" WHERE run_id = ? AND region IN ({','.join('?' * len(regions))}))")
+            params += [run_id, *regions]
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM run_results{where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM run_results{where} ORDER BY {sort} {'DESC' if descending else 'ASC'}, position"
+                " LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def run_review(self, run_id: str) -> dict[int, tuple[bool, Optional[str]]]:
+        """{position: (reviewed, edited_reasoning)} for the rows of a run a reviewer ticked or edited."""
+        with self._connect() as conn:
+            return {position: (bool(reviewed), edited) for position, reviewed, edited in conn.execute(
+                "SELECT position, reviewed, edited_reasoning FROM run_results"
+                " WHERE run_id = ? AND (reviewed = 1 OR edited_reasoning IS NOT NULL)", (run_id,)
+            )}
+
+    def update_run_row(self, run_id: str, position: int, reviewed: Optional[bool] = None,
+                       edited_reasoning: Optional[str] = None) -> bool:
+        """Record a reviewer's tick and/or reasoning edit on one row of a run; False if there is no such row."""
+        assignments, params = [], []
+        if reviewed is not None:
+            assignments.append("reviewed = ?")
+            params.append(int(reviewed))
+        if edited_reasoning is not None:
+            assignments.append("edited_reasoning = ?")
+            params.append(edited_reasoning)
+        with self._connect() as conn:
+            if not assignments:
+                return conn.execute("SELECT 1 FROM run_results WHERE run_id = ? AND position = ?",
+                                    (run_id, position)).fetchone() is not None
+            return conn.execute(
+                f"UPDATE run_results SET {', '.join(assignments)} WHERE run_id = ? AND position = ?",
+                params + [run_id, position]
+            ).rowcount > 0
+
+    def delete_runs_before(self, cutoff: float) -> list[str]:
+        """Drop the rows of every run saved before `cutoff` (unix timestamp); returns the deleted run ids."""
+        with self._connect() as conn:
+            run_ids = [r for (r,) in conn.execute("SELECT run_id FROM runs WHERE created_at < ?", (cutoff,))]
+            for table in ("run_results", "run_result_regions", "runs"):
+                conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", [(r,) for r in run_ids])
+        return run_ids
+
+    def run_regions(self, run_id: str) -> list[str]:
+        """Distinct geo regions in a run, for the region filter."""
+        with self._connect() as conn:
+            return [r for (r,) in conn.execute(
+                "SELECT DISTINCT region FROM run_result_regions WHERE run_id = ? ORDER BY region", (run_id,)
+            )]
@@ -0,0 +1,328 @@
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+
+import pandas as pd
+
+from .singleflight import feature_flight_key
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_INDEX_PATH = os.path.join(PROJECT_ROOT, "outputs", "retrieval_index.sqlite3")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def feature_key(feature_name: str, feature_description: str, location: Optional[str]) -> str:
+    """
+    Stable key for a feature analysis: same content + location -> same key. Normalized like single-flight
+    keys, since duplicate rows that differ only in case / whitespace share one analysis.
+    """
+    return _sha256("\x1f".join(feature_flight_key(feature_name, feature_description, location)))
+
+
+def scan_corpus(base_path: str = "regulations") -> dict[tuple[str, str], tuple[str, float]]:
+    """
+    Hash every regulation file that gets ingested into a collection (all .txt files one level below base_path).
+    Returns {(directory, filename): (sha256, mtime)}.
+    """
+    corpus = {}
+    if not os.path.isdir(base_path):
+        print(f"Warning: Regulations directory not found at '{base_path}'.")
+        return corpus
+    for directory in os.listdir(base_path):
+        dir_path = os.path.join(base_path, directory)
+        if not os.path.isdir(dir_path):
+            continue
+        for filename in os.listdir(dir_path):
+            if not filename.endswith(".txt"):
+                continue
+            file_path = os.path.join(dir_path, filename)
+            with open(file_path, "r", encoding="utf-8") as f:
+                corpus[(directory, filename)] = (_sha256(f.read()), os.path.getmtime(file_path))
+    return corpus
+
+
+class RetrievalIndex:
+    """
+    Persistent reverse index of which regulation chunks / source files were retrieved for each analyzed feature,
+    plus a snapshot of the regulation corpus as it is ingested in Chroma. Used to re-run only the features whose
+    retrieved context touched a regulation file that has since changed.
+    Results files are registered row by row (record_results), so a re-run updates exactly the rows that came
+    from the affected analyses, not every row that happens to share a feature name. Each results file also keeps
+    the corpus version its verdicts were produced against, so re-analyzing one file doesn't mark a regulation
+    change as handled for the others.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, base_path: str = "regulations"):
+        self.path = path
+        self.base_path = base_path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "CREATE TABLE IF NOT EXISTS features ("
+                " feature_key TEXT PRIMARY KEY, feature_name TEXT NOT NULL, feature_description TEXT NOT NULL,"
+                " location TEXT, analyzed_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS feature_collections ("
+                " feature_key TEXT NOT NULL, collection TEXT NOT NULL, PRIMARY KEY (feature_key, collection));"
+                "CREATE INDEX IF NOT EXISTS idx_feature_collections_collection ON feature_collections(collection);"
+                "CREATE TABLE IF NOT EXISTS feature_chunks ("
+                " feature_key TEXT NOT NULL, collection TEXT NOT NULL, source TEXT NOT NULL, chunk_hash TEXT NOT NULL,"
+                " PRIMARY KEY (feature_key, collection, source, chunk_hash));"
+                "CREATE INDEX IF NOT EXISTS idx_feature_chunks_source ON feature_chunks(collection, source);"
+                "CREATE TABLE IF NOT EXISTS corpus_files ("
+                " directory TEXT NOT NULL, filename TEXT NOT NULL, sha256 TEXT NOT NULL, mtime REAL NOT NULL,"
+                " PRIMARY KEY (directory, filename));"
+                "CREATE TABLE IF NOT EXISTS result_rows ("
+                " results_path TEXT NOT NULL, row INTEGER NOT NULL, column_prefix TEXT NOT NULL,"
+                " feature_key TEXT NOT NULL, PRIMARY KEY (results_path, row, column_prefix));"
+                "CREATE TABLE IF NOT EXISTS result_corpus ("
+                " results_path TEXT NOT NULL, directory TEXT NOT NULL, filename TEXT NOT NULL, sha256 TEXT NOT NULL,"
+                " PRIMARY KEY (results_path, directory, filename));"
+            )
+            empty = conn.execute("SELECT COUNT(*) FROM corpus_files").fetchone()[0] == 0
+        if empty:
+            # first use: assume the Chroma collections match the regulations currently on disk
+            self.snapshot_corpus()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, feature_name: str, feature_description: str, location: Optional[str], retrieved_results: dict):
+        """Record the collections queried and the chunks retrieved for one feature analysis (replacing older entries)."""
+        key = feature_key(feature_name, feature_description, location)
+        chunks = {
+            (collection, hit["source"], _sha256(hit["doc_snippet"]))
+            for collection, hits in retrieved_results.items()
+            for hit in hits
+            if "doc_snippet" in hit and hit.get("source")
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO features (feature_key, feature_name, feature_description, location, analyzed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, feature_name, feature_description, location, time.time())
+            )
+            conn.execute("DELETE FROM feature_collections WHERE feature_key = ?", (key,))
+            conn.execute("DELETE FROM feature_chunks WHERE feature_key = ?", (key,))
+            conn.executemany("INSERT INTO feature_collections (feature_key, collection) VALUES (?, ?)",
+                             [(key, collection) for collection in retrieved_results])
+            conn.executemany("INSERT INTO feature_chunks (feature_key, collection, source, chunk_hash) VALUES (?, ?, ?, ?)",
+                             [(key, *chunk) for chunk in chunks])
+
+    def record_results(self, results_path: str, entries: list[tuple[int, str, str]]):
+        """
+        Register which analysis produced each row of a results CSV: entries are (row, column_prefix, feature_key),
+        with column_prefix "" for the plain layouts and "<location> | " for the columns of a wide matrix CSV.
+        The file is recorded as produced against the currently ingested corpus.
+        """
+        path = os.path.abspath(results_path)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM result_rows WHERE results_path = ?", (path,))
+            conn.executemany(
+                "INSERT INTO result_rows (results_path, row, column_prefix, feature_key) VALUES (?, ?, ?, ?)",
+                [(path, row, prefix, key) for row, prefix, key in entries]
+            )
+            conn.execute("DELETE FROM result_corpus WHERE results_path = ?", (path,))
+            conn.execute(
+                "INSERT INTO result_corpus (results_path, directory, filename, sha256)"
+                " SELECT ?, directory, filename, sha256 FROM corpus_files", (path,)
+            )
+
+    def forget_results(self, results_path: str):
+        """Drop the row registrations of a results CSV (e.g. one deleted by retention)."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM result_rows WHERE results_path = ?", (os.path.abspath(results_path),))
+            conn.execute("DELETE FROM result_corpus WHERE results_path = ?", (os.path.abspath(results_path),))
+
+    def result_rows(self, results_path: str) -> list[tuple[int, str, str]]:
+        """[(row, column_prefix, feature_key)] registered for a results CSV (empty if it wasn't recorded)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT row, column_prefix, feature_key FROM result_rows WHERE results_path = ? ORDER BY row",
+                (os.path.abspath(results_path),)
+            ).fetchall()
+
+    def snapshot_corpus(self):
+        """Store the current regulation corpus hashes as the ingested state."""
+        corpus = scan_corpus(self.base_path)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM corpus_files")
+            conn.executemany(
+                "INSERT INTO corpus_files (directory, filename, sha256, mtime) VALUES (?, ?, ?, ?)",
+                [(d, f, sha, mtime) for (d, f), (sha, mtime) in corpus.items()]
+            )
+
+    def update_snapshot(self, diff: dict[str, dict[str, list[str]]]):
+        """Mark only the files in `diff` as ingested in their current on-disk state (after syncing them)."""
+        with self._connect() as conn:
+            for directory, files in diff.items():
+                for filename in files["deleted"]:
+                    conn.execute("DELETE FROM corpus_files WHERE directory = ? AND filename = ?", (directory, filename))
+                for filename in files["changed"] + files["new"]:
+                    file_path = os.path.join(self.base_path, directory, filename)
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        sha = _sha256(f.read())
+                    conn.execute(
+                        "INSERT OR REPLACE INTO corpus_files (directory, filename, sha256, mtime) VALUES (?, ?, ?, ?)",
+                        (directory, filename, sha, os.path.getmtime(file_path))
+                    )
+
+    def update_results_corpus(self, results_path: str, diff: dict[str, dict[str, list[str]]]):
+        """Mark a results file as up to date with the current on-disk state of the files in `diff`."""
+        path = os.path.abspath(results_path)
+        with self._connect() as conn:
+            for directory, files in diff.items():
+                for filename in files["deleted"]:
+                    conn.execute("DELETE FROM result_corpus WHERE results_path = ? AND directory = ? AND filename = ?",
+                                 (path, directory, filename))
+                for filename in files["changed"] + files["new"]:
+                    with open(os.path.join(self.base_path, directory, filename), "r", encoding="utf-8") as f:
+                        sha = _sha256(f.read())
+                    conn.execute(
+                        "INSERT OR REPLACE INTO result_corpus (results_path, directory, filename, sha256)"
+                        " VALUES (?, ?, ?, ?)", (path, directory, filename, sha)
+                    )
+
+    def diff_corpus(self, changed_since: Optional[datetime] = None,
+                    results_path: Optional[str] = None) -> dict[str, dict[str, list[str]]]:
+        """
+        Diff the regulation corpus on disk against the ingested snapshot, or with `results_path` against the corpus
+        that results file was produced against (the ingested snapshot for files registered without one).
+        With `changed_since`, only files modified after that time count as changed/new (deleted files always count).
+        Returns {directory: {"changed": [...], "new": [...], "deleted": [...]}} for directories with differences.
+        """
+        current = scan_corpus(self.base_path)
+        with self._connect() as conn:
+            snapshot = {}
+            if results_path is not None:
+                snapshot = {(d, f): sha for d, f, sha in conn.execute(
+                    "SELECT directory, filename, sha256 FROM result_corpus WHERE results_path = ?",
+                    (os.path.abspath(results_path),)
+                )}
+            if not snapshot:
+                snapshot = {(d, f): sha for d, f, sha in conn.execute(
+                    "SELECT directory, filename, sha256 FROM corpus_files")}
+
+        since = changed_since.timestamp() if changed_since else None
+        diff = {}
+
+        def add(kind: str, directory: str, filename: str):
+            diff.setdefault(directory, {"changed": [], "new": [], "deleted": []})[kind].append(filename)
+
+        for (directory, filename), (sha, mtime) in sorted(current.items()):
+            if since is not None and mtime <= since:
+                continue
+            if (directory, filename) not in snapshot:
+                add("new", directory, filename)
+            elif since is not None or snapshot[(directory, filename)] != sha:
+                add("changed", directory, filename)
+        for directory, filename in sorted(set(snapshot) - set(current)):
+            add("deleted", directory, filename)
+        return diff
+
+    def affected_features(self, diff: dict[str, dict[str, list[str]]]) -> list[dict]:
+        """
+        Features whose retrieved context touched a changed or deleted file, or that queried a collection
+        which gained new files (a new chunk may now rank in its top-k).
+        Returns [{"feature_key", "feature_name", "feature_description", "location"}].
+        """
+        keys = set()
+        with self._connect() as conn:
+            for directory, files in diff.items():
+                for filename in files["changed"] + files["deleted"]:
+                    keys.update(k for (k,) in conn.execute(
+                        "SELECT feature_key FROM feature_chunks WHERE collection = ? AND source = ?",
+                        (directory, filename)
+                    ))
+                if files["new"]:
+                    keys.update(k for (k,) in conn.execute(
+                        "SELECT feature_key FROM feature_collections WHERE collection = ?", (directory,)
+                    ))
+            if not keys:
+                return []
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                "SELECT feature_key, feature_name, feature_description, location FROM features"
+                f" WHERE feature_key IN ({placeholders}) ORDER BY analyzed_at",
+                list(keys)
+            ).fetchall()
+        return [
+            {"feature_key": k, "feature_name": n, "feature_description": d, "location": loc}
+            for k, n, d, loc in rows
+        ]
+
+
+def reanalyze_changed(index: RetrievalIndex, results_path: str, pipeline_factory: Callable,
+                      changed_since: Optional[datetime] = None,
+                      on_rows_updated: Optional[Callable[[dict], None]] = None) -> int:
+    """
+    Re-run only the analyses behind `results_path` whose retrieved regulation context changed, and update
+    the rows they produced in place. `pipeline_factory(location)` builds the pipeline used for features
+    analyzed with that location. `on_rows_updated({row: ComplianceResult})`, if given, is called with the new
+    verdicts of the plain-layout rows (e.g. to update a web run's stored rows). Returns the number of
+    re-analyzed features.
+    """
+    from .rag_system import sync_regulation_files
+
+    rows = index.result_rows(results_path)
+    if not rows:
+        print(f"{results_path} is not registered in {index.path}, so its rows can't be matched to analyses.")
+        return 0
+
+    # what changed since this file's verdicts were produced, and what Chroma hasn't ingested yet: another
+    # results file may already have been re-analyzed (and the change ingested) for the same edit
+    diff = index.diff_corpus(changed_since, results_path)
+    ingest_diff = index.diff_corpus(changed_since)
+    if not diff:
+        print("No regulation changes found, nothing to re-analyze.")
+        return 0
+    for directory, files in diff.items():
+        print(f"{directory}: {len(files['changed'])} changed, {len(files['new'])} new, {len(files['deleted'])} deleted")
+    for directory, files in ingest_diff.items():
+        sync_regulation_files(directory, files["changed"] + files["new"] + files["deleted"], index.base_path)
+    # only the files synced above are now ingested; edits older than --changed-since stay pending
+    index.update_snapshot(ingest_diff)
+
+    affected = {feature["feature_key"]: feature for feature in index.affected_features(diff)}
+    targets = [(row, prefix, key) for row, prefix, key in rows if key in affected]
+    keys = list(dict.fromkeys(key for _, _, key in targets))
+    print(f"{len(keys)} analyses behind {len(targets)} of {len(rows)} rows in {results_path} touched changed regulations")
+
+    by_location = {}
+    for key in keys:
+        by_location.setdefault(affected[key]["location"], []).append(affected[key])
+    new_results = {}
+    for location, features in by_location.items():
+        pipeline = pipeline_factory(location)
+        results = pipeline.process_dataset(pd.DataFrame(features))
+        if len(results) != len(features):
+            raise RuntimeError(f"expected {len(features)} results, got {len(results)}")
+        new_results.update((feature["feature_key"], result) for feature, result in zip(features, results))
+
+    df = pd.read_csv(results_path)
+    for row, prefix, key in targets:
+        for column, value in new_results[key].to_dict().items():
+            # rows keep their own spelling of the feature name
+            if column != "feature_name" and prefix + column in df.columns:
+                df[prefix + column] = df[prefix + column].astype(object)
+                df.at[row, prefix + column] = value
+
+    # keep the CSV's own layout (e.g. deploy/app.py writes the index column)
+    df.to_csv(results_path, index=False)
+    index.update_results_corpus(results_path, diff)
+    if on_rows_updated is not None:
+        on_rows_updated({row: new_results[key] for row, prefix, key in targets if prefix == ""})
+    return len(keys)
@@ -0,0 +1,51 @@
+import re
+import threading
+from typing import Any, Callable, Hashable, Optional
+
+
+def feature_flight_key(feature_name: str, feature_description: str, location: Optional[str]) -> tuple:
+    """Normalized identity of an analysis request: case- and whitespace-insensitive name, description and location."""
+    def norm(text) -> str:
+        return re.sub(r"\s+", " ", str(text or "")).strip().casefold()
+    return norm(feature_name), norm(feature_description), norm(location)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function, every caller that arrives
+    while it is still running waits for and shares its result (or exception). Nothing is cached afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
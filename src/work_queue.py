@@ -0,0 +1,416 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional
+
+import pandas as pd
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:  # redis is optional, only Redis queues need it
+    class WatchError(Exception):
+        """A watched key changed before EXEC (redis.exceptions.WatchError when redis is installed)."""
+
+
+DEFAULT_LEASE_SECONDS = 15 * 60
+MAX_ATTEMPTS = 3
+
+
+# interface for shard queues shared by a coordinator and any number of worker processes / hosts
+class WorkQueue(ABC):
+    """
+    Durable queue of input shards. A shard is a JSON list of rows
+    {"row": <input position>, "feature_name": ..., "feature_description": ...}.
+    Workers claim a shard under a lease and keep extending it while they work on it; a shard whose lease
+    expires (crashed or hung worker) is handed out again, and marked failed once it has used MAX_ATTEMPTS.
+    """
+
+    @abstractmethod
+    def reset(self, shards: list[str]):
+        """Drop any previous run and enqueue the given shard payloads, in order."""
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[tuple[int, str]]:
+        """Claim the next available shard. Returns (shard_id, payload) or None if nothing is left to claim."""
+        pass
+
+    @abstractmethod
+    def extend(self, shard_id: int, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Renew the lease on a shard this worker holds. Returns False if the lease was lost (expired and re-claimed)."""
+        pass
+
+    @abstractmethod
+    def complete(self, shard_id: int, worker_id: str, result: str) -> bool:
+        """
+        Store the partial result payload for a shard this worker holds and mark it done.
+        Returns False (and changes nothing) if the lease was lost to another worker.
+        """
+        pass
+
+    @abstractmethod
+    def fail(self, shard_id: int, worker_id: str, error: str) -> bool:
+        """
+        Release a shard this worker holds after an error so it can be retried (or marked failed after MAX_ATTEMPTS).
+        Returns False (and changes nothing) if the lease was lost to another worker.
+        """
+        pass
+
+    @abstractmethod
+    def results(self) -> list[tuple[int, str]]:
+        """Return [(shard_id, result_payload)] for every completed shard, ordered by shard id."""
+        pass
+
+    @abstractmethod
+    def counts(self) -> dict[str, int]:
+        """Return the number of shards per status: pending, running, done, failed."""
+        pass
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Shard queue in a local SQLite file; safe to share between processes on one host or a shared volume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                " id INTEGER PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " worker TEXT,"
+                " lease_expires REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " result TEXT,"
+                " error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_status ON shards(status)")
+
+    @contextmanager
+    def _connect(self):
+        # autocommit mode; transactions are opened explicitly where atomicity matters
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def reset(self, shards: list[str]):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM shards")
+            conn.executemany("INSERT INTO shards (id, payload) VALUES (?, ?)", list(enumerate(shards)))
+            conn.execute("COMMIT")
+
+    def claim(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[tuple[int, str]]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # expired leases that already used every attempt (e.g. the shard keeps killing its worker) are given up
+            conn.execute(
+                "UPDATE shards SET status = 'failed', lease_expires = NULL,"
+                " error = 'lease expired after ' || attempts || ' attempts'"
+                " WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM shards"
+                " WHERE status = 'pending' OR (status = 'running' AND lease_expires < ?)"
+                " ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE shards SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1"
+                " WHERE id = ?",
+                (worker_id, now + lease_seconds, row[0])
+            )
+            conn.execute("COMMIT")
+            return row[0], row[1]
+
+    def extend(self, shard_id: int, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, shard_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, shard_id: int, worker_id: str, result: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET status = 'done', result = ?, error = NULL, lease_expires = NULL"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (result, shard_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, shard_id: int, worker_id: str, error: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " error = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                (MAX_ATTEMPTS, error, shard_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def results(self) -> list[tuple[int, str]]:
+        with self._connect() as conn:
+            return conn.execute("SELECT id, result FROM shards WHERE status = 'done' ORDER BY id").fetchall()
+
+    def counts(self) -> dict[str, int]:
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        with self._connect() as conn:
+            for status, n in conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status"):
+                counts[status] = n
+        return counts
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    Shard queue on a Redis-style broker, for workers spread across hosts.
+    Every state change that spans keys runs as a WATCH/MULTI/EXEC transaction, so a worker dying mid-claim
+    can't lose a shard. Only a small command subset is used (list/hash commands plus pipelines).
+    """
+
+    def __init__(self, client, prefix: str = "compliance"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    @staticmethod
+    def _str(value) -> Optional[str]:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _transaction(self, watch: list[str], fn):
+        """Run fn(pipe) with the `watch` keys watched, retrying if another client changed them before EXEC."""
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*[self._key(k) for k in watch])
+                    return fn(pipe)
+                except WatchError:
+                    continue
+
+    def reset(self, shards: list[str]):
+        with self.client.pipeline() as pipe:
+            pipe.delete(*[self._key(k) for k in
+                          ("pending", "payload", "running", "owner", "attempts", "results", "failed")])
+            for shard_id, payload in enumerate(shards):
+                pipe.hset(self._key("payload"), shard_id, payload)
+            if shards:
+                pipe.rpush(self._key("pending"), *range(len(shards)))
+            pipe.execute()
+
+    def _expire_leases(self, now: float):
+        """Requeue shards whose lease expired, or mark them failed once they used MAX_ATTEMPTS."""
+        for shard_id, expires in self.client.hgetall(self._key("running")).items():
+            if float(self._str(expires)) >= now:
+                continue
+            shard_id = self._str(shard_id)
+
+            def expire(pipe):
+                expires = pipe.hget(self._key("running"), shard_id)
+                if expires is None or float(self._str(expires)) >= now:
+                    return  # finished or renewed in the meantime
+                attempts = int(self._str(pipe.hget(self._key("attempts"), shard_id)) or 0)
+                pipe.multi()
+                pipe.hdel(self._key("running"), shard_id)
+                pipe.hdel(self._key("owner"), shard_id)
+                if attempts >= MAX_ATTEMPTS:
+                    pipe.hset(self._key("failed"), shard_id, f"lease expired after {attempts} attempts")
+                else:
+                    pipe.rpush(self._key("pending"), shard_id)
+                pipe.execute()
+
+            self._transaction(["running"], expire)
+
+    def claim(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[tuple[int, str]]:
+        now = time.time()
+        self._expire_leases(now)
+
+        def take(pipe):
+            shard_id = self._str(pipe.lindex(self._key("pending"), 0))
+            if shard_id is None:
+                return None
+            pipe.multi()
+            pipe.lpop(self._key("pending"))
+            pipe.hset(self._key("running"), shard_id, now + lease_seconds)
+            pipe.hset(self._key("owner"), shard_id, worker_id)
+            pipe.hincrby(self._key("attempts"), shard_id, 1)
+            pipe.hget(self._key("payload"), shard_id)
+            payload = pipe.execute()[-1]
+            return int(shard_id), self._str(payload)
+
+        return self._transaction(["pending"], take)
+
+    def extend(self, shard_id: int, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        def renew(pipe):
+            if not self._owns(pipe, shard_id, worker_id):
+                return False
+            pipe.multi()
+            pipe.hset(self._key("running"), shard_id, time.time() + lease_seconds)
+            pipe.execute()
+            return True
+
+        return self._transaction(["owner", "running"], renew)
+
+    def _owns(self, pipe, shard_id: int, worker_id: str) -> bool:
+        return self._str(pipe.hget(self._key("owner"), shard_id)) == worker_id \
+            and pipe.hget(self._key("running"), shard_id) is not None
+
+    def complete(self, shard_id: int, worker_id: str, result: str) -> bool:
+        def finish(pipe):
+            if not self._owns(pipe, shard_id, worker_id):
+                return False
+            pipe.multi()
+            pipe.hset(self._key("results"), shard_id, result)
+            pipe.hdel(self._key("running"), shard_id)
+            pipe.hdel(self._key("owner"), shard_id)
+            pipe.execute()
+            return True
+
+        return self._transaction(["owner", "running"], finish)
+
+    def fail(self, shard_id: int, worker_id: str, error: str) -> bool:
+        def release(pipe):
+            if not self._owns(pipe, shard_id, worker_id):
+                return False
+            attempts = int(self._str(pipe.hget(self._key("attempts"), shard_id)) or 0)
+            pipe.multi()
+            pipe.hdel(self._key("running"), shard_id)
+            pipe.hdel(self._key("owner"), shard_id)
+            if attempts >= MAX_ATTEMPTS:
+                pipe.hset(self._key("failed"), shard_id, error)
+            else:
+                pipe.rpush(self._key("pending"), shard_id)
+            pipe.execute()
+            return True
+
+        return self._transaction(["owner", "running", "attempts"], release)
+
+    def results(self) -> list[tuple[int, str]]:
+        results = self.client.hgetall(self._key("results"))
+        return sorted((int(self._str(k)), self._str(v)) for k, v in results.items())
+
+    def counts(self) -> dict[str, int]:
+        return {
+            "pending": self.client.llen(self._key("pending")),
+            "running": self.client.hlen(self._key("running")),
+            "done": self.client.hlen(self._key("results")),
+            "failed": self.client.hlen(self._key("failed")),
+        }
+
+
+def open_queue(url: str) -> WorkQueue:
+    """
+    Open a queue from a URL: 'redis://host:6379/0' for a Redis broker (requires the `redis` package),
+    anything else is treated as a SQLite file path (an optional 'sqlite:///' prefix is stripped).
+    """
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Redis queues need the 'redis' package: pip install redis") from e
+        return RedisWorkQueue(redis.Redis.from_url(url))
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteWorkQueue(url)
+
+
+def enqueue_csv(queue: WorkQueue, csv_path: str, shard_size: int = 50) -> int:
+    """Split an input CSV into shards of `shard_size` rows and (re)fill the queue. Returns the shard count."""
+    df = pd.read_csv(csv_path)
+    rows = [
+        {"row": i, "feature_name": row["feature_name"], "feature_description": row["feature_description"]}
+        for i, (_, row) in enumerate(df.iterrows())
+    ]
+    shards = [json.dumps(rows[start:start + shard_size]) for start in range(0, len(rows), shard_size)]
+    queue.reset(shards)
+    print(f"Enqueued {len(rows)} features from {csv_path} as {len(shards)} shards")
+    return len(shards)
+
+
+@contextmanager
+def lease_heartbeat(queue: WorkQueue, shard_id: int, worker_id: str, lease_seconds: float):
+    """Keep extending the lease on a claimed shard (every third of the lease) while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                if not queue.extend(shard_id, worker_id, lease_seconds):
+                    print(f"[WARN] [{worker_id}] lost the lease on shard {shard_id}; it may be processed twice")
+                    return
+            except Exception as e:
+                print(f"[WARN] [{worker_id}] could not extend the lease on shard {shard_id}: {e}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(queue: WorkQueue, pipeline, worker_id: Optional[str] = None,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+    """
+    Pull shards until the queue is drained, analyze each with `pipeline.process_dataset` and store the
+    partial results on the queue. Returns the number of shards this worker completed.
+    """
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    completed = 0
+    while True:
+        claimed = queue.claim(worker_id, lease_seconds)
+        if claimed is None:
+            break
+        shard_id, payload = claimed
+        rows = json.loads(payload)
+        print(f"[{worker_id}] shard {shard_id}: {len(rows)} features")
+        try:
+            with lease_heartbeat(queue, shard_id, worker_id, lease_seconds):
+                results = pipeline.process_dataset(pd.DataFrame(rows))
+            if len(results) != len(rows):
+                raise RuntimeError(f"expected {len(rows)} results, got {len(results)}")
+            if not queue.complete(shard_id, worker_id, json.dumps([
+                {"row": row["row"], "feature_description": row["feature_description"], **result.to_dict()}
+                for row, result in zip(rows, results)
+            ])):
+                print(f"[WARN] [{worker_id}] lost the lease on shard {shard_id}; its results were discarded")
+                continue
+            completed += 1
+        except Exception as e:
+            print(f"[ERROR] [{worker_id}] shard {shard_id} failed: {e}")
+            if not queue.fail(shard_id, worker_id, str(e)):
+                print(f"[WARN] [{worker_id}] lost the lease on shard {shard_id}; left to its new owner")
+    print(f"[{worker_id}] queue drained, completed {completed} shards")
+    return completed
+
+
+def merged_rows(queue: WorkQueue) -> list[dict]:
+    """Result rows of every completed shard in input order, with each row's input description."""
+    counts = queue.counts()
+    if counts["pending"] or counts["running"]:
+        print(f"Warning: merging an unfinished run ({counts})")
+    if counts["failed"]:
+        print(f"Warning: {counts['failed']} shards failed and are missing from the merged results")
+
+    merged = []
+    for _, payload in queue.results():
+        merged.extend(json.loads(payload))
+    merged.sort(key=lambda r: r["row"])
+    return merged
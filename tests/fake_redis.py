@@ -0,0 +1,136 @@
+import threading
+from typing import Optional
+
+from src.work_queue import WatchError
+
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the Redis commands RedisWorkQueue uses, including WATCH/MULTI/EXEC pipelines,
+    so the Redis queue can be tested without a broker: RedisWorkQueue(InMemoryRedis()).
+    Values are stored as strings like Redis does; only shared between threads of one process.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def _touch(self, key: str):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self._touch(key)
+                    removed += 1
+            return removed
+
+    def rpush(self, key: str, *values) -> int:
+        with self._lock:
+            items = self._data.setdefault(key, [])
+            items.extend(str(v) for v in values)
+            self._touch(key)
+            return len(items)
+
+    def lpop(self, key: str) -> Optional[str]:
+        with self._lock:
+            items = self._data.get(key)
+            if not items:
+                return None
+            self._touch(key)
+            return items.pop(0)
+
+    def lindex(self, key: str, index: int) -> Optional[str]:
+        with self._lock:
+            items = self._data.get(key, [])
+            return items[index] if -len(items) <= index < len(items) else None
+
+    def llen(self, key: str) -> int:
+        with self._lock:
+            return len(self._data.get(key, []))
+
+    def hset(self, key: str, field, value) -> int:
+        with self._lock:
+            fields = self._data.setdefault(key, {})
+            added = str(field) not in fields
+            fields[str(field)] = str(value)
+            self._touch(key)
+            return int(added)
+
+    def hget(self, key: str, field) -> Optional[str]:
+        with self._lock:
+            return self._data.get(key, {}).get(str(field))
+
+    def hdel(self, key: str, *fields) -> int:
+        with self._lock:
+            existing = self._data.get(key, {})
+            removed = sum(existing.pop(str(f), None) is not None for f in fields)
+            if removed:
+                self._touch(key)
+            return removed
+
+    def hgetall(self, key: str) -> dict[str, str]:
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+    def hlen(self, key: str) -> int:
+        with self._lock:
+            return len(self._data.get(key, {}))
+
+    def hincrby(self, key: str, field, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._data.get(key, {}).get(str(field), 0)) + amount
+            self.hset(key, field, value)
+            return value
+
+    def pipeline(self) -> "_InMemoryPipeline":
+        return _InMemoryPipeline(self)
+
+
+class _InMemoryPipeline:
+    """redis-py pipeline semantics: commands are buffered, except between watch() and multi() where they run."""
+
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+        self.reset()
+
+    def reset(self):
+        self._watched = {}
+        self._commands = []
+        self._buffering = True
+
+    def watch(self, *keys):
+        with self.client._lock:
+            self._watched = {key: self.client._versions.get(key, 0) for key in keys}
+        self._buffering = False
+
+    def multi(self):
+        self._buffering = True
+
+    def execute(self) -> list:
+        with self.client._lock:
+            try:
+                if any(self.client._versions.get(k, 0) != v for k, v in self._watched.items()):
+                    raise WatchError("watched key changed")
+                return [getattr(self.client, name)(*args) for name, args in self._commands]
+            finally:
+                self.reset()
+
+    def __getattr__(self, name: str):
+        command = getattr(self.client, name)
+
+        def call(*args):
+            if not self._buffering:
+                return command(*args)
+            self._commands.append((name, args))
+            return self
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
@@ -0,0 +1,36 @@
+import random
+
+from src.concurrency import AdaptiveLimiter
+
+
+def run(limiter, latencies):
+    for latency in latencies:
+        limiter.acquire()
+        limiter.release(latency)
+
+
+def reasons(limiter):
+    return [reason for _, _, _, reason in limiter.history]
+
+
+def test_jitter_does_not_cut_the_limit():
+    rng = random.Random(0)
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=64, cooldown=0)
+    run(limiter, [rng.lognormvariate(0, 0.5) for _ in range(5000)])
+    assert "latency" not in reasons(limiter)
+    assert limiter.limit == 64
+
+
+def test_single_slow_call_does_not_cut_the_limit():
+    limiter = AdaptiveLimiter("test", initial=8, cooldown=0)
+    run(limiter, [1.0] * 100 + [10.0] + [1.0] * 10)
+    assert "latency" not in reasons(limiter)
+
+
+def test_sustained_latency_rise_decreases_then_recovers():
+    limiter = AdaptiveLimiter("test", initial=32, max_limit=32, cooldown=0)
+    run(limiter, [1.0] * 200)
+    run(limiter, [4.0] * 40)
+    assert limiter.limit < 32
+    run(limiter, [4.0] * 3000)
+    assert limiter.limit == 32
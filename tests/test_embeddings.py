@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+from tokenizers import Tokenizer, models, pre_tokenizers  # noqa: E402
+
+from src import embeddings  # noqa: E402
+from src.embeddings import EmbeddingEngine  # noqa: E402
+
+VOCAB = "[UNK] a b c d e f g h i".split()
+DIM = 4
+
+
+@pytest.fixture(scope="module")
+def table():
+    return np.random.default_rng(0).normal(size=(len(VOCAB), DIM)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory, table):
+    """A toy model with all-MiniLM's ONNX signature: last_hidden_state is a plain embedding lookup of input_ids."""
+    path = tmp_path_factory.mktemp("model")
+    inputs = [helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "tokens"])
+              for name in ("input_ids", "attention_mask", "token_type_ids")]
+    output = helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "tokens", DIM])
+    graph = helper.make_graph([helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+                              "toy", inputs, [output], [numpy_helper.from_array(table, "table")])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(path / "model.onnx"))
+    tokenizer = Tokenizer(models.WordLevel({word: i for i, word in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(path / "tokenizer.json"))
+    return path
+
+
+def expected(texts, table):
+    """Mean over the real tokens (no padding), then L2-normalized."""
+    pooled = np.stack([table[[VOCAB.index(w) for w in text.split()]].mean(axis=0) for text in texts])
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+TEXTS = ["a", "b c d e f g", "h i", "c c c", "d e f g h i a b", "e"]
+
+
+def test_mixed_length_batches_keep_input_order_and_ignore_padding(model_dir, table, monkeypatch):
+    monkeypatch.setattr(embeddings, "MAX_BATCH_SIZE", 2)
+    out = EmbeddingEngine(model_dir, quantized=False).encode(TEXTS)
+    assert out.shape == (len(TEXTS), DIM)
+    np.testing.assert_allclose(out, expected(TEXTS, table), atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(out, axis=1), 1.0, atol=1e-5)
+
+
+def test_batches_are_longest_first_and_token_bounded(model_dir, monkeypatch):
+    monkeypatch.setattr(embeddings, "MAX_BATCH_TOKENS", 12)
+    engine = EmbeddingEngine(model_dir, quantized=False)
+    engine._load()
+    encodings = engine._tokenizer.encode_batch(TEXTS)
+    batches = engine._batches(encodings)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(TEXTS)))
+    lengths = [len(encodings[i].ids) for batch in batches for i in batch]
+    assert lengths == sorted(lengths, reverse=True)
+    for batch in batches:
+        assert len(batch) == 1 or len(encodings[batch[0]].ids) * len(batch) <= 12
+
+
+def test_query_cache_evicts_least_recently_used(model_dir, table, monkeypatch):
+    engine = EmbeddingEngine(model_dir, quantized=False, cache_size=2)
+    encoded = []
+    real_encode = engine._encode
+    monkeypatch.setattr(engine, "_encode", lambda texts: encoded.append(list(texts)) or real_encode(texts))
+
+    engine(["a", "b c"])
+    engine(["a"])          # hit, "a" becomes most recent
+    engine(["d", "a"])     # "d" evicts "b c"
+    engine(["b c", "a"])
+    assert encoded == [["a", "b c"], ["d"], ["b c"]]
+    assert sorted(engine._cache) == ["a", "b c"]
+    np.testing.assert_allclose(np.stack(engine(["b c"])), expected(["b c"], table), atol=1e-5)
+
+
+def test_prefetch_fills_the_cache_up_to_its_size(model_dir):
+    engine = EmbeddingEngine(model_dir, quantized=False, cache_size=3)
+    engine.prefetch(TEXTS)
+    assert list(engine._cache) == TEXTS[:3]
+
+
+def test_int8_model_stays_close_to_fp32(model_dir, table):
+    out = EmbeddingEngine(model_dir, quantized=True).encode(TEXTS)
+    assert (model_dir / "model_int8.onnx").exists()
+    assert np.min(np.sum(out * expected(TEXTS, table), axis=1)) > 0.99
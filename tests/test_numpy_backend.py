@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src import numpy_backend, rag_system
+from src.numpy_backend import NumpyBackend
+from src.rag_system import COLLECTION_NAMES, query_collections
+
+
+class FakeCollection:
+    def __init__(self, name, vectors):
+        self.name = name
+        self.vectors = vectors
+
+    def get(self, include):
+        ids = [f"{self.name}-{i}" for i in range(len(self.vectors))]
+        return {"ids": ids, "embeddings": self.vectors, "documents": [f"{self.name} chunk {i}" for i in ids],
+                "metadatas": [{"source": f"{self.name}.txt"} for _ in ids]}
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    rng = np.random.default_rng(0)
+    collections = {name: FakeCollection(name, rng.normal(size=(3, 8)).astype(np.float32))
+                   for name in COLLECTION_NAMES}
+    monkeypatch.setattr(numpy_backend, "get_collection", collections.get)
+    return collections
+
+
+def test_query_matches_brute_force(tmp_path, collections):
+    backend = NumpyBackend(str(tmp_path))
+    name = next(iter(collections))
+    vectors = collections[name].vectors
+    hits = backend.query([name, "missing"], vectors[:1] * 3, top_k=2)[0]
+    assert hits["missing"] == [{"error": "Collection not found"}]
+    assert [h["doc_snippet"] for h in hits[name]][0] == f"{name} chunk {name}-0"
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert hits[name][0]["distance"] == pytest.approx(0.0, abs=1e-5)
+    assert hits[name][1]["distance"] == pytest.approx(
+        np.sort(2 - 2 * normalized[1:] @ normalized[0])[0], abs=1e-5)
+
+
+def test_empty_index_returns_no_hits(tmp_path, collections):
+    for collection in collections.values():
+        collection.vectors = np.zeros((0, 8), dtype=np.float32)
+    backend = NumpyBackend(str(tmp_path))
+    assert backend.query(list(COLLECTION_NAMES), np.ones((1, 8)), top_k=3) == [{n: [] for n in COLLECTION_NAMES}]
+
+
+def test_rebuilds_when_chroma_changes(tmp_path, collections, monkeypatch):
+    monkeypatch.setattr(numpy_backend, "FINGERPRINT_CHECK_SECONDS", 0)
+    backend = NumpyBackend(str(tmp_path))
+    name = next(iter(collections))
+    backend.query([name], np.ones((1, 8)))
+    collections[name].vectors = np.ones((1, 8), dtype=np.float32)
+    hits = backend.query([name], np.ones((1, 8)), top_k=5)[0][name]
+    assert len(hits) == 1 and hits[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_queries_during_rebuilds_see_one_consistent_export(tmp_path, collections, monkeypatch):
+    monkeypatch.setattr(numpy_backend, "FINGERPRINT_CHECK_SECONDS", 0)
+    backend = NumpyBackend(str(tmp_path))
+    name = next(iter(collections))
+    errors, stop = [], threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                for hit in backend.query([name], np.ones((1, 8)), top_k=10)[0][name]:
+                    # every snippet belongs to the same export as the matrix row it was ranked by
+                    assert hit["doc_snippet"].startswith(f"{name} chunk")
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for size in [1, 7, 2, 9, 3] * 4:
+        collections[name].vectors = np.ones((size, 8), dtype=np.float32)
+        backend.refresh()
+    stop.set()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_query_collections_uses_the_active_backend(tmp_path, collections, monkeypatch):
+    monkeypatch.setattr(rag_system, "_embedding_function", lambda texts: [np.ones(8) for _ in texts])
+    monkeypatch.setattr(rag_system, "_backend", None)
+    rag_system.set_backend(NumpyBackend(str(tmp_path)))
+    name = next(iter(collections))
+    assert len(query_collections([name], "feature", top_k=2)[name]) == 2
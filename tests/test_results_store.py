@@ -0,0 +1,103 @@
+import pytest
+
+from src.data_handler import ComplianceFlag, ComplianceResult
+from src.results_store import ResultsStore
+
+
+def verdict(name="Teen mode", flag=ComplianceFlag.REQUIRED, regions=("EU",), regulations=("EU DSA",),
+            reasoning="because"):
+    return ComplianceResult(feature_name=name, compliance_flag=flag, confidence_score=0.8, reasoning=reasoning,
+                            related_regulations=list(regulations), geo_regions=list(regions), source_file="act.txt")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultsStore(str(tmp_path / "results.sqlite3"))
+
+
+def test_run_rows_keep_review_state_until_reanalyzed(store):
+    store.save_run("run", [verdict("a"), verdict("b", regions=["US"])])
+    assert store.update_run_row("run", 1, reviewed=True, edited_reasoning="checked")
+    assert not store.update_run_row("run", 5, reviewed=True)
+    assert store.run_review("run") == {1: (True, "checked")}
+
+    assert store.update_run_results("run", {1: verdict("b", ComplianceFlag.NOT_REQUIRED, regions=["CA"])}) == 1
+    assert store.update_run_results("other", {0: verdict()}) == 0
+    _, rows = store.run_page("run", regions=["ca"])
+    assert [(r["position"], r["compliance_flag"], r["reviewed"], r["edited_reasoning"]) for r in rows] == \
+        [(1, "NOT_REQUIRED", 0, None)]
+    assert store.run_regions("run") == ["CA", "EU"]
+
+
+def test_delete_runs_before(store):
+    store.save_run("old", [verdict()])
+    assert store.delete_runs_before(0) == []
+    assert store.delete_runs_before(float("inf")) == ["old"]
+    assert store.run_page("old") == (0, [])
+
+
+def test_get_put_keyed_on_content_model_and_corpus(store):
+    store.put(verdict(), "Age-gated feed", "EU", "model-1", "corpus-1")
+    # normalized content: case and whitespace differences hit the same entry, under the caller's spelling
+    hit = store.get("  teen MODE", "age-gated   feed", "eu", "model-1", "corpus-1")
+    assert hit.feature_name == "  teen MODE"
+    assert hit.compliance_flag == ComplianceFlag.REQUIRED and hit.geo_regions == ["EU"]
+    assert store.get("Teen mode", "Age-gated feed", "EU", "model-2", "corpus-1") is None
+    assert store.get("Teen mode", "Age-gated feed", "EU", "model-1", "corpus-2") is None
+    assert store.get("Teen mode", "Age-gated feed", "US", "model-1", "corpus-1") is None
+    assert store.get("Teen mode", "Other feed", "EU", "model-1", "corpus-1") is None
+
+    # put on the same key replaces the verdict rather than adding a row
+    store.put(verdict(flag=ComplianceFlag.NOT_REQUIRED), "Age-gated feed", "EU", "model-1", "corpus-1")
+    assert store.get("Teen mode", "Age-gated feed", "EU", "model-1", "corpus-1").compliance_flag == \
+        ComplianceFlag.NOT_REQUIRED
+    assert store.count() == 1
+
+
+def test_query_filters(store):
+    store.put(verdict("Teen mode"), "d1", "EU", "m1", "c1")
+    store.put(verdict("Geo unlock", ComplianceFlag.NOT_REQUIRED, regions=["US", "CA"], regulations=["COPPA"]),
+              "d2", "US", "m1", "c1")
+    store.put(verdict("Teen chat", ComplianceFlag.UNCERTAIN, regions=["EU", "US"], regulations=["EU DSA", "COPPA"]),
+              "d3", None, "m2", "c1")
+
+    def names(**filters):
+        return sorted(row["feature_name"] for row in store.query(**filters))
+
+    assert names(regulation="coppa") == ["Geo unlock", "Teen chat"]
+    assert names(region="eu") == ["Teen chat", "Teen mode"]
+    assert names(regulation="eu dsa", region="us") == ["Teen chat"]
+    assert names(flag="not_required") == ["Geo unlock"]
+    assert names(location="US") == ["Geo unlock"]
+    assert names(feature="teen") == ["Teen chat", "Teen mode"]
+    assert names(model_version="m2") == ["Teen chat"]
+    assert store.count(region="US") == 2
+    assert store.count(regulation="GDPR") == 0
+    assert [row["feature_name"] for row in store.query(sort="feature_name", descending=False, limit=2)] == \
+        ["Geo unlock", "Teen chat"]
+
+
+def test_sort_columns_are_validated(store):
+    with pytest.raises(ValueError):
+        list(store.query(sort="reasoning; DROP TABLE results"))
+    with pytest.raises(ValueError):
+        store.run_page("run", sort="reviewed")
+
+
+def test_run_page_filters_sorts_and_pages(store):
+    store.save_run("run", [verdict("a", regions=["EU"]),
+                           verdict("b", ComplianceFlag.NOT_REQUIRED, regions=["US"]),
+                           verdict("c", ComplianceFlag.UNCERTAIN, regions=["EU", "US"]),
+                           verdict("d", ComplianceFlag.REQUIRED, regions=[])])
+    store.save_run("other", [verdict("x")])
+
+    total, rows = store.run_page("run", limit=2, offset=1)
+    assert total == 4 and [r["feature_name"] for r in rows] == ["b", "c"]
+    total, rows = store.run_page("run", flags=["required", "uncertain"])
+    assert total == 3 and [r["feature_name"] for r in rows] == ["a", "c", "d"]
+    total, rows = store.run_page("run", regions=["us"], sort="feature_name", descending=True)
+    assert total == 2 and [r["feature_name"] for r in rows] == ["c", "b"]
+    total, rows = store.run_page("run", flags=["REQUIRED"], regions=["EU"])
+    assert total == 1 and [r["feature_name"] for r in rows] == ["a"]
+    with pytest.raises(ValueError):
+        store.run_page("run", flags=["maybe"])
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from src.data_handler import ComplianceFlag, ComplianceResult
+from src.retrieval_index import RetrievalIndex, feature_key, reanalyze_changed
+
+LOCATION = "Utah state law"
+
+
+@pytest.fixture
+def regulations(tmp_path):
+    directory = tmp_path / "regulations" / "UTAH_SocialMediaRegulation"
+    directory.mkdir(parents=True)
+    (directory / "act.txt").write_text("original text", encoding="utf-8")
+    return tmp_path / "regulations"
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    calls = []
+    monkeypatch.setattr("src.rag_system.sync_regulation_files",
+                        lambda directory, filenames, base_path: calls.append((directory, list(filenames))))
+    return calls
+
+
+class FakePipeline:
+    def __init__(self, reasoning):
+        self.reasoning = reasoning
+
+    def process_dataset(self, df):
+        return [
+            ComplianceResult(feature_name=row["feature_name"], compliance_flag=ComplianceFlag.REQUIRED,
+                             confidence_score=0.9, reasoning=self.reasoning, related_regulations=[],
+                             geo_regions=[], source_file="act.txt")
+            for _, row in df.iterrows()
+        ]
+
+
+def write_results(index, path, features):
+    pd.DataFrame([{"feature_name": name, "compliance_flag": "NOT_REQUIRED", "reasoning": "old"}
+                  for name, _ in features]).to_csv(path, index=False)
+    index.record_results(str(path), [(row, "", feature_key(name, desc, LOCATION))
+                                     for row, (name, desc) in enumerate(features)])
+
+
+def test_each_results_file_is_reanalyzed_for_the_same_change(tmp_path, regulations, synced):
+    index = RetrievalIndex(str(tmp_path / "index.sqlite3"), base_path=str(regulations))
+    features = [("Teen mode", "curfew for minors"), ("Feed", "ranked feed")]
+    for name, desc in features:
+        index.record(name, desc, LOCATION, {"UTAH_SocialMediaRegulation": [
+            {"doc_snippet": "original text", "source": "act.txt", "distance": 0.1}]})
+    # two results files from the same run, then one regulation file is amended
+    write_results(index, tmp_path / "a.csv", features)
+    write_results(index, tmp_path / "b.csv", features[:1])
+    (regulations / "UTAH_SocialMediaRegulation" / "act.txt").write_text("amended text", encoding="utf-8")
+
+    factory = lambda location: FakePipeline("new")
+    updated = []
+    assert reanalyze_changed(index, str(tmp_path / "a.csv"), factory, on_rows_updated=updated.append) == 2
+    assert [sorted(rows) for rows in updated] == [[0, 1]]
+    assert reanalyze_changed(index, str(tmp_path / "b.csv"), factory) == 1
+    # the change is ingested once, and each file is up to date afterwards
+    assert synced == [("UTAH_SocialMediaRegulation", ["act.txt"])]
+    assert reanalyze_changed(index, str(tmp_path / "a.csv"), factory) == 0
+    assert reanalyze_changed(index, str(tmp_path / "b.csv"), factory) == 0
+    assert list(pd.read_csv(tmp_path / "a.csv")["reasoning"]) == ["new", "new"]
+    assert list(pd.read_csv(tmp_path / "b.csv")["reasoning"]) == ["new"]
+
+
+def test_unregistered_results_file_is_not_touched(tmp_path, regulations, synced):
+    index = RetrievalIndex(str(tmp_path / "index.sqlite3"), base_path=str(regulations))
+    pd.DataFrame([{"feature_name": "x", "reasoning": "old"}]).to_csv(tmp_path / "c.csv", index=False)
+    (regulations / "UTAH_SocialMediaRegulation" / "act.txt").write_text("amended text", encoding="utf-8")
+    assert reanalyze_changed(index, str(tmp_path / "c.csv"), lambda location: FakePipeline("new")) == 0
+    assert synced == []
@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from src import compliance_analyzer
+from src.compliance_analyzer import LLMCompliancePipeline
+from src.data_handler import ComplianceFlag, ComplianceResult
+from src.llm import StubProvider
+from src.singleflight import SingleFlight, feature_flight_key
+
+WAITERS = 8
+
+
+class CountingEvent(threading.Event):
+    """Event that counts the threads waiting on it."""
+
+    def __init__(self):
+        super().__init__()
+        self.waiters = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiters.release()
+        return super().wait(timeout)
+
+
+def run_concurrently(flight, key, fn):
+    """Call flight.do(key, fn) from WAITERS threads that all join while the first call is still running."""
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def leader_fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def call():
+        try:
+            return flight.do(key, leader_fn)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=WAITERS) as executor:
+        first = executor.submit(call)
+        assert started.wait(5)
+        done = flight._calls[key].done = CountingEvent()
+        rest = [executor.submit(call) for _ in range(WAITERS - 1)]
+        for _ in rest:
+            assert done.waiters.acquire(timeout=5)
+        release.set()
+        outcomes = [first.result()] + [f.result() for f in rest]
+    return calls, outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    result = object()
+    calls, outcomes = run_concurrently(flight, "k", lambda: result)
+    assert len(calls) == 1
+    assert all(outcome is result for outcome in outcomes)
+    assert flight._calls == {}
+    # nothing is cached: the next call runs the function again
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    error = RuntimeError("provider down")
+
+    def boom():
+        raise error
+
+    calls, outcomes = run_concurrently(flight, "k", boom)
+    assert len(calls) == 1
+    assert all(outcome is error for outcome in outcomes)
+    assert flight._calls == {}
+
+
+def test_feature_flight_key_ignores_case_and_whitespace():
+    assert feature_flight_key(" Teen  Mode", "Age\tgate", "EU") == feature_flight_key("teen mode", "age gate ", "eu")
+    assert feature_flight_key("Teen mode", "Age gate", None) != feature_flight_key("Teen mode", "Age gate", "EU")
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(compliance_analyzer, "prefetch_query_embeddings", lambda queries: None)
+    pipeline = LLMCompliancePipeline(StubProvider(latency_ms=0), location="EU Digital Service Act",
+                                     flight=SingleFlight())
+    analyzed = []
+
+    def analyze_feature(feature_name, feature_description):
+        analyzed.append((feature_name, feature_description))
+        return ComplianceResult(feature_name=feature_name, compliance_flag=ComplianceFlag.REQUIRED,
+                                confidence_score=0.9, reasoning=f"{feature_name}: {feature_description}",
+                                related_regulations=["EU DSA"], geo_regions=["EU"], source_file="dsa.txt")
+
+    monkeypatch.setattr(pipeline, "analyze_feature", analyze_feature)
+    pipeline.analyzed = analyzed
+    return pipeline
+
+
+def test_process_dataset_collapses_duplicates_and_fans_out(pipeline):
+    df = pd.DataFrame({
+        "feature_name": ["Teen mode", "Geo unlock", "TEEN  MODE ", "teen mode"],
+        "feature_description": ["Age-gated feed", "Unlock by region", "age-gated   FEED", "Age-gated feed"],
+    })
+    results = pipeline.process_dataset(df)
+
+    assert sorted(pipeline.analyzed) == [("Geo unlock", "Unlock by region"), ("Teen mode", "Age-gated feed")]
+    assert [r.feature_name for r in results] == ["Teen mode", "Geo unlock", "TEEN  MODE ", "teen mode"]
+    # duplicates share the verdict of the first spelling
+    assert {r.reasoning for i, r in enumerate(results) if i != 1} == {"Teen mode: Age-gated feed"}
+    assert results[1].reasoning == "Geo unlock: Unlock by region"
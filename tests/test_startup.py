@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from benchmarks.bench_startup import DEFAULT_BUDGET_SECONDS, STARTUP_PATHS, eagerly_imported, time_startup
+
+
+@pytest.fixture
+def env(tmp_path):
+    # deploy.app opens its results store and output dir at import; keep them out of the tree
+    return dict(os.environ, OUTPUT_DIR=str(tmp_path), RESULTS_STORE_PATH=str(tmp_path / "results.sqlite3"),
+                RETRIEVAL_INDEX_PATH=str(tmp_path / "retrieval_index.sqlite3"))
+
+
+@pytest.mark.parametrize("path", list(STARTUP_PATHS))
+def test_startup_path_is_lazy_and_within_budget(path, env):
+    assert eagerly_imported(STARTUP_PATHS[path], env) == []
+    assert time_startup(STARTUP_PATHS[path], runs=3, env=env) <= DEFAULT_BUDGET_SECONDS
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+import pytest
+
+from fake_redis import InMemoryRedis
+from src.data_handler import ComplianceFlag, ComplianceResult
+from src.work_queue import MAX_ATTEMPTS, RedisWorkQueue, SQLiteWorkQueue, merged_rows, run_worker
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteWorkQueue(str(tmp_path / "queue.sqlite"))
+    return RedisWorkQueue(InMemoryRedis())
+
+
+def shards(n):
+    return [json.dumps([{"row": i, "feature_name": f"f{i}", "feature_description": f"d{i}"}]) for i in range(n)]
+
+
+def test_claims_each_shard_once_in_order(queue):
+    queue.reset(shards(3))
+    claimed = [queue.claim("w1"), queue.claim("w2"), queue.claim("w1")]
+    assert [shard_id for shard_id, _ in claimed] == [0, 1, 2]
+    assert queue.claim("w3") is None
+    assert queue.counts() == {"pending": 0, "running": 3, "done": 0, "failed": 0}
+
+    for (shard_id, _), worker in zip(claimed, ["w1", "w2", "w1"]):
+        assert queue.complete(shard_id, worker, f"result {shard_id}")
+    assert queue.results() == [(0, "result 0"), (1, "result 1"), (2, "result 2")]
+    assert queue.counts()["done"] == 3
+
+
+def test_concurrent_claims_never_hand_out_a_shard_twice(queue):
+    queue.reset(shards(50))
+    claimed, lock = [], threading.Lock()
+
+    def worker(name):
+        while (c := queue.claim(name)) is not None:
+            with lock:
+                claimed.append(c[0])
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == list(range(50))
+
+
+def test_expired_lease_is_retried_then_failed(queue):
+    queue.reset(shards(1))
+    for attempt in range(MAX_ATTEMPTS):
+        claimed = queue.claim(f"w{attempt}", lease_seconds=-1)  # worker "crashes": lease already expired
+        assert claimed is not None and claimed[0] == 0
+    assert queue.claim("w-last") is None
+    assert queue.counts() == {"pending": 0, "running": 0, "done": 0, "failed": 1}
+
+
+def test_extend_keeps_the_lease_for_its_owner_only(queue):
+    queue.reset(shards(1))
+    shard_id, _ = queue.claim("w1", lease_seconds=-1)
+    assert queue.extend(shard_id, "w1", lease_seconds=60)
+    assert not queue.extend(shard_id, "w2", lease_seconds=60)
+    assert queue.claim("w2") is None  # renewed lease is not handed out again
+
+
+def test_lost_lease_cannot_be_extended(queue):
+    queue.reset(shards(1))
+    shard_id, _ = queue.claim("w1", lease_seconds=-1)
+    assert queue.claim("w2")[0] == shard_id
+    assert not queue.extend(shard_id, "w1")
+
+
+def test_fail_retries_until_max_attempts(queue):
+    queue.reset(shards(1))
+    for _ in range(MAX_ATTEMPTS):
+        shard_id, _ = queue.claim("w1")
+        assert queue.fail(shard_id, "w1", "boom")
+    assert queue.claim("w1") is None
+    assert queue.counts()["failed"] == 1
+
+
+def test_stale_worker_cannot_fail_or_complete_a_reclaimed_shard(queue):
+    queue.reset(shards(1))
+    shard_id, _ = queue.claim("w1", lease_seconds=-1)
+    assert queue.claim("w2")[0] == shard_id
+    # w1 comes back after its lease expired: w2 keeps the shard
+    assert not queue.fail(shard_id, "w1", "boom")
+    assert queue.claim("w3") is None
+    assert not queue.complete(shard_id, "w1", "stale result")
+    assert queue.counts() == {"pending": 0, "running": 1, "done": 0, "failed": 0}
+    assert queue.complete(shard_id, "w2", "result")
+    assert queue.results() == [(shard_id, "result")]
+
+
+class FakePipeline:
+    def process_dataset(self, df):
+        time.sleep(0.05)
+        return [
+            ComplianceResult(feature_name=row["feature_name"], compliance_flag=ComplianceFlag.NOT_REQUIRED,
+                             confidence_score=0.9, reasoning="ok", related_regulations=[], geo_regions=[],
+                             source_file="N/A")
+            for _, row in df.iterrows()
+        ]
+
+
+def test_run_worker_and_merge(queue):
+    queue.reset(shards(4))
+    # lease shorter than a shard's processing time, so the heartbeat is exercised
+    assert run_worker(queue, FakePipeline(), worker_id="w1", lease_seconds=0.03) == 4
+    merged = [ComplianceResult.from_dict(row) for row in merged_rows(queue)]
+    assert [r.feature_name for r in merged] == ["f0", "f1", "f2", "f3"]